@@ -0,0 +1,533 @@
+# bench.py
+# Benchmarks for the Sansad backend
+#
+# Run:
+#   python bench.py ingest-concurrency --pdf sample.pdf --uploads 64 --concurrency 16
+#   python bench.py ask-load [--url http://localhost:8000] [--requests 500] [--concurrency 16] [--stream]
+#   python bench.py startup [--module rag_pipeline] [--runs 5]
+#   python bench.py llm [--requests 200] [--concurrency 32] [--latency 0.8] [--duplicates 0.5]
+#   python bench.py hybrid [--queries 200]      (after ingesting, e.g. PDF_DIR=chroma_db/data/pdfs python rag_pipeline.py)
+#   python bench.py chunking [--pdf transcript.pdf] [--pages 500] [--tokenizer sentence-transformers/all-MiniLM-L6-v2]
+#   python bench.py embeddings [--backends torch,onnx,onnx-int8] [--pages 20]
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from textwrap import wrap
+
+import httpx
+
+# ===============================
+# HELPERS
+# ===============================
+
+def percentiles(samples: list[float]) -> dict:
+    """p50/p95/p99/max in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "n": len(ordered),
+        "p50": round(pick(0.50), 1),
+        "p95": round(pick(0.95), 1),
+        "p99": round(pick(0.99), 1),
+        "max": round(ordered[-1] * 1000, 1),
+        "mean": round(statistics.fmean(ordered) * 1000, 1),
+    }
+
+
+def report(name: str, samples: list[float], wall: float | None = None):
+    line = f"{name:<14} " + "  ".join(f"{k}={v}" for k, v in percentiles(samples).items())
+    if wall:
+        line += f"  rate={len(samples) / wall:.1f}/s"
+    print(line)
+
+# ===============================
+# INGEST CONCURRENCY
+# ===============================
+
+async def bench_ingest_concurrency(args):
+    """
+    Parallel /ingest-file uploads while /health is polled on the side.
+    Each upload gets a unique trailing PDF comment so it is parsed instead
+    of being short-circuited as a duplicate, so run it against a scratch
+    data directory.
+    """
+    with open(args.pdf, "rb") as f:
+        pdf_bytes = f.read()
+
+    upload_times, health_times = [], []
+    sem = asyncio.Semaphore(args.concurrency)
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=300) as client:
+
+        async def upload():
+            body = pdf_bytes + b"\n%" + uuid.uuid4().hex.encode() + b"\n"
+            async with sem:
+                t0 = time.perf_counter()
+                resp = await client.post(
+                    "/ingest-file",
+                    files={"file": ("bench.pdf", body, "application/pdf")},
+                    data={"source": "bench"},
+                )
+                upload_times.append(time.perf_counter() - t0)
+                resp.raise_for_status()
+
+        async def poll_health():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                await client.get("/health")
+                health_times.append(time.perf_counter() - t0)
+                await asyncio.sleep(0.05)
+
+        poller = asyncio.create_task(poll_health())
+        t0 = time.perf_counter()
+        await asyncio.gather(*(upload() for _ in range(args.uploads)))
+        wall = time.perf_counter() - t0
+        done.set()
+        await poller
+
+    print(f"{args.uploads} uploads of {len(pdf_bytes) / 1e6:.1f} MB, concurrency {args.concurrency}, {wall:.1f}s")
+    report("/ingest-file", upload_times, wall)
+    report("/health", health_times)
+
+# ===============================
+# ASK LOAD
+# ===============================
+
+QUESTIONS = [
+    "What was discussed about the budget?",
+    "Which bills were passed in this session?",
+    "What did the opposition say about the amendment?",
+    "Summarize the question hour",
+    "Was the house adjourned, and when?",
+    "What issues did members raise about the ministry of finance?",
+    "Which committee reports were tabled?",
+    "What points of order were raised?",
+]
+
+async def bench_ask_load(args):
+    """
+    Closed-loop load on /ask: `concurrency` clients send `requests` questions
+    in total. A `repeat` fraction reuses earlier questions (as real traffic
+    does); the rest are made unique so they miss every cache. With --stream,
+    time to the first streamed piece is reported separately from the total.
+    """
+    rnd = random.Random(args.seed)
+    latencies, first_token, errors = [], [], 0
+    sem = asyncio.Semaphore(args.concurrency)
+
+    def question(i):
+        base = rnd.choice(QUESTIONS)
+        return base if rnd.random() < args.repeat else f"{base} (variant {i})"
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+
+        async def one(i):
+            nonlocal errors
+            async with sem:
+                t0 = time.perf_counter()
+                if not args.stream:
+                    resp = await client.post("/ask", json={"question": question(i)})
+                    if resp.status_code != 200:
+                        errors += 1
+                        return
+                    latencies.append(time.perf_counter() - t0)
+                    return
+
+                async with client.stream(
+                    "POST", "/ask", params={"stream": "true"}, json={"question": question(i)}
+                ) as resp:
+                    if resp.status_code != 200:
+                        errors += 1
+                        return
+                    first = None
+                    async for line in resp.aiter_lines():
+                        if first is None and line.startswith("data: "):
+                            first = time.perf_counter() - t0
+                        if line.startswith("event: error"):
+                            errors += 1
+                            return
+                    first_token.append(first)
+                    latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        wall = time.perf_counter() - t0
+        health = (await client.get("/health")).json()
+
+    print(f"{args.requests} questions, concurrency {args.concurrency}, {wall:.1f}s, "
+          f"QPS {len(latencies) / wall:.1f}, errors {errors}")
+    if first_token:
+        report("first token", first_token)
+    report("/ask total", latencies, wall)
+    for name in ("query_cache", "answer_cache"):
+        print(f"{name:<14} {health.get(name)}")
+
+# ===============================
+# LLM CLIENT
+# ===============================
+
+async def bench_llm(args):
+    """
+    Offline LLMClient throughput against FakeBackend: `requests` prompts from
+    `concurrency` callers, a `duplicates` fraction of them repeats of a few
+    hot prompts. The baseline is one-at-a-time calls straight to the backend,
+    which is what the synchronous generate_content loop does.
+    """
+    from llm_client import FakeBackend, LLMClient
+
+    rnd = random.Random(args.seed)
+    hot = [f"hot prompt {i}" for i in range(4)]
+    prompts = [
+        rnd.choice(hot) if rnd.random() < args.duplicates else f"prompt {i}"
+        for i in range(args.requests)
+    ]
+
+    def backend():
+        return FakeBackend(latency=args.latency, jitter=args.latency / 4,
+                           rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+
+    # ---- Baseline: sequential, no coalescing ----
+    base = backend()
+    sample = prompts[:args.baseline_requests]
+    t0 = time.perf_counter()
+    for p in sample:
+        while True:
+            try:
+                async for _ in base.stream(p):
+                    pass
+                break
+            except Exception:
+                await asyncio.sleep(args.latency)
+    base_wall = time.perf_counter() - t0
+    print(f"sequential     {len(sample) / base_wall:8.1f} answers/s  ({len(sample)} answers, {base.calls} upstream calls)")
+
+    # ---- LLMClient ----
+    client = LLMClient(backend(), max_concurrency=args.llm_concurrency, backoff=args.latency / 2)
+    sem = asyncio.Semaphore(args.concurrency)
+    latencies, first_piece = [], []
+
+    async def one(p):
+        async with sem:
+            t0 = time.perf_counter()
+            first = None
+            async for _ in client.stream(p):
+                if first is None:
+                    first = time.perf_counter() - t0
+            first_piece.append(first)
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one(p) for p in prompts), return_exceptions=True)
+    wall = time.perf_counter() - t0
+    await client.close()
+
+    failed = sum(isinstance(r, Exception) for r in results)
+    print(f"LLMClient      {len(latencies) / wall:8.1f} answers/s  ({len(latencies)} answers, {failed} failed)")
+    report("first piece", first_piece)
+    report("total", latencies, wall)
+    print(f"client stats   {client.stats}")
+
+# ===============================
+# HYBRID RETRIEVAL
+# ===============================
+
+def bench_hybrid(args):
+    """
+    Known-item retrieval on the ingested corpus: for sampled chunks, ask with
+    the chunk's rarest terms (the bill numbers, names and dates keyword
+    queries hinge on) and see where each retriever ranks that chunk.
+    """
+    import numpy as np
+    import rag_pipeline as rp
+    from bm25_index import tokenize
+
+    index = rp.resources.bm25.get()
+    if index is None or not len(index):
+        sys.exit("No BM25 index yet; run ingestion (python rag_pipeline.py, option 1) first")
+
+    rnd = random.Random(args.seed)
+    sample = rnd.sample(index.ids, min(args.queries, len(index.ids)))
+    got = rp.resources.collection.get(ids=sample, include=["documents"])
+    df = np.diff(index.offsets.astype(np.int64))
+
+    queries = []
+    for cid, doc in zip(got["ids"], got["documents"]):
+        terms = [t for t in set(tokenize(doc)) if t in index.terms]
+        rare = sorted(terms, key=lambda t: (df[index.terms[t]], t))[:args.terms]
+        if rare:
+            queries.append((cid, " ".join(rare)))
+    print(f"{len(index)} chunks indexed, {len(queries)} queries of up to {args.terms} rare terms, k={rp.RETRIEVE_K}")
+
+    def dense(q):
+        return rp.dense_search(rp.embed_text(q), rp.RETRIEVE_K)["ids"]
+
+    def keyword(q):
+        return [cid for cid, _ in rp.bm25_search(q, rp.RETRIEVE_K)]
+
+    def hybrid(q):
+        return rp.search(q)[0]["ids"]
+
+    dense(queries[0][1])  # load the model before timing anything
+    for name, fn in (("dense", dense), ("bm25", keyword), ("hybrid", hybrid)):
+        times, hits, rr = [], 0, 0.0
+        for cid, q in queries:
+            t0 = time.perf_counter()
+            ids = fn(q)
+            times.append(time.perf_counter() - t0)
+            if cid in ids:
+                hits += 1
+                rr += 1 / (ids.index(cid) + 1)
+        print(f"{name:<7} recall@{rp.RETRIEVE_K}={hits / len(queries):.3f}  MRR={rr / len(queries):.3f}")
+        report(f"  {name}", times)
+
+    print(f"hybrid stats   {rp.resources.hybrid_stats.stats()}  (budget {rp.BM25_BUDGET_MS} ms)")
+
+# ===============================
+# CHUNKING
+# ===============================
+
+SPEAKERS = ["SHRI ANURAG THAKUR", "SHRIMATI SUPRIYA SULE", "HON. SPEAKER", "SHRI RAHUL GANDHI"]
+VOCAB = (
+    "the bill amendment house member government minister question hour "
+    "session debate clause committee report budget ministry state national "
+    "sir madam hon'ble point order discussion motion passed adjourned"
+).split()
+
+def synthetic_transcript(pages: int, words_per_page=550, seed=7) -> list[str]:
+    """Debate-like page texts: speaker turns, short lines, some dates"""
+    rnd = random.Random(seed)
+    out = []
+    for p in range(pages):
+        lines = [f"LOK SABHA DEBATES {25 + p % 5}-11-2024 Page {p + 1}"]
+        remaining = words_per_page
+        while remaining > 0:
+            n = min(remaining, rnd.randint(5, 14))
+            line = " ".join(rnd.choice(VOCAB) for _ in range(n))
+            if rnd.random() < 0.1:
+                line = f"{rnd.choice(SPEAKERS)}: {line}"
+            lines.append(line)
+            remaining -= n
+        out.append("\n".join(lines))
+    return out
+
+def _old_word_chunker(text: str, target_words=400, overlap=0.2):
+    # ingest_service.chunk_text before chunking.py
+    words = text.split()
+    chunks = []
+    step = int(target_words * (1 - overlap)) or target_words
+    i = 0
+    while i < len(words):
+        chunks.append(" ".join(words[i:i + target_words]))
+        i += step
+    return chunks
+
+def best_of(fn, repeat: int) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def bench_chunking(args):
+    from chunking import chunk_by_chars, chunk_by_words, join_pages, ChunkedText
+
+    if args.pdf:
+        from pdf_extract import extract_text_and_meta
+        text, _ = extract_text_and_meta(args.pdf)
+        pages = text.split("\n\n")
+    else:
+        pages = synthetic_transcript(args.pages)
+
+    text, page_starts = join_pages(pages)
+    print(f"{len(pages)} pages, {len(text) / 1e6:.2f} M chars, {len(text.split())} words")
+
+    cases = [
+        ("old words (ingest_service)", lambda: _old_word_chunker(text)),
+        ("chunk_by_words spans", lambda: chunk_by_words(text, page_starts=page_starts)),
+        ("chunk_by_words + slice", lambda: ChunkedText(text, chunk_by_words(text, page_starts=page_starts)).texts()),
+        ("old textwrap (rag_pipeline)", lambda: wrap(text, 1200)),
+        ("chunk_by_chars spans", lambda: chunk_by_chars(text, 1200, page_starts=page_starts)),
+        ("chunk_by_chars + slice", lambda: ChunkedText(text, chunk_by_chars(text, 1200, page_starts=page_starts)).texts()),
+    ]
+    if args.tokenizer:
+        from tokenizers import Tokenizer
+        from chunking import chunk_by_tokens, detached_tokenizer
+
+        if args.tokenizer.endswith(".json"):
+            tok = detached_tokenizer(Tokenizer.from_file(args.tokenizer))
+        else:
+            tok = detached_tokenizer(Tokenizer.from_pretrained(args.tokenizer))
+        cases.append((
+            "chunk_by_tokens (254)",
+            lambda: chunk_by_tokens(text, tok, max_tokens=254, page_starts=page_starts),
+        ))
+
+    for name, fn in cases:
+        secs, result = best_of(fn, args.repeat)
+        print(f"{name:<30} {secs * 1000:9.1f} ms  {len(result):6d} chunks")
+
+# ===============================
+# EMBEDDING BACKENDS
+# ===============================
+
+# Lowest acceptable cosine to the reference backend, per backend
+PARITY_MIN_COSINE = {"torch": 0.999, "onnx": 0.999, "onnx-int8": 0.98}
+
+def bench_embeddings(args):
+    """
+    Throughput of each embedding backend on the same transcript chunks, and
+    parity: per-chunk cosine similarity to the first (reference) backend.
+    Exits non-zero if any backend falls below its minimum cosine.
+    """
+    import numpy as np
+    from chunking import chunk_by_tokens, chunk_pages, detached_tokenizer
+    from embeddings import load_embedder
+    from rag_pipeline import EMBEDDING_MODEL_NAME, ONNX_MODEL_DIR
+
+    backends = args.backends.split(",")
+    embedders = {b: load_embedder(b, EMBEDDING_MODEL_NAME, args.onnx_dir or ONNX_MODEL_DIR) for b in backends}
+
+    ref = embedders[backends[0]]
+    texts = chunk_pages(
+        synthetic_transcript(args.pages), chunk_by_tokens,
+        tokenizer=detached_tokenizer(ref.tokenizer), max_tokens=ref.max_seq_length - 2,
+    ).texts()
+    print(f"{len(texts)} chunks of up to {ref.max_seq_length - 2} tokens, batch size {args.batch_size}")
+
+    vectors = {}
+    for name, embedder in embedders.items():
+        embedder.encode(texts[:args.batch_size], batch_size=args.batch_size)  # warm up
+        secs, vectors[name] = best_of(lambda: embedder.encode(texts, batch_size=args.batch_size), args.repeat)
+        print(f"{name:<10} {secs:8.2f} s  {len(texts) / secs:8.1f} chunks/s")
+
+    failed = False
+    base = vectors[backends[0]]
+    base = base / np.linalg.norm(base, axis=1, keepdims=True)
+    for name in backends[1:]:
+        if vectors[name].shape != base.shape:
+            print(f"{name} vs {backends[0]}: dimensions differ {vectors[name].shape} vs {base.shape} FAIL")
+            failed = True
+            continue
+        v = vectors[name] / np.linalg.norm(vectors[name], axis=1, keepdims=True)
+        cos = (v * base).sum(axis=1)
+        floor = args.min_cosine or PARITY_MIN_COSINE.get(name, 0.99)
+        ok = cos.min() >= floor
+        failed |= not ok
+        print(
+            f"{name} vs {backends[0]}: cosine min={cos.min():.4f} mean={cos.mean():.4f} "
+            f"(need >= {floor}) {'OK' if ok else 'FAIL'}"
+        )
+
+    if failed:
+        sys.exit(1)
+
+# ===============================
+# STARTUP
+# ===============================
+
+def bench_startup(args):
+    """
+    Wall time of a fresh `import <module>` in a new interpreter, with
+    GEMINI_API_KEY unset: the import must neither need it nor load models.
+    """
+    env = {k: v for k, v in os.environ.items() if k != "GEMINI_API_KEY"}
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = (
+        "import time; t0 = time.perf_counter(); "
+        f"import {args.module}; "
+        "print(time.perf_counter() - t0)"
+    )
+
+    samples = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=here, env=env, capture_output=True, text=True, check=True,
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+
+    report(f"import {args.module}", samples)
+
+# ===============================
+# ENTRY POINT
+# ===============================
+
+def main():
+    parser = argparse.ArgumentParser(description="Sansad backend benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("ingest-concurrency", help="p99 latency of parallel uploads")
+    p.add_argument("--url", default="http://localhost:8001")
+    p.add_argument("--pdf", required=True)
+    p.add_argument("--uploads", type=int, default=64)
+    p.add_argument("--concurrency", type=int, default=16)
+    p.set_defaults(func=lambda a: asyncio.run(bench_ingest_concurrency(a)))
+
+    p = sub.add_parser("ask-load", help="QPS and latency percentiles of /ask")
+    p.add_argument("--url", default="http://localhost:8000")
+    p.add_argument("--requests", type=int, default=500)
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--repeat", type=float, default=0.5, help="fraction of repeated questions")
+    p.add_argument("--timeout", type=float, default=120)
+    p.add_argument("--stream", action="store_true", help="use SSE and report time to first token")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=lambda a: asyncio.run(bench_ask_load(a)))
+
+    p = sub.add_parser("llm", help="offline LLMClient throughput against a fake backend")
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=32, help="concurrent callers")
+    p.add_argument("--llm-concurrency", type=int, default=8, help="LLMClient upstream slots")
+    p.add_argument("--latency", type=float, default=0.8, help="fake seconds per answer")
+    p.add_argument("--duplicates", type=float, default=0.5, help="fraction of hot, repeated prompts")
+    p.add_argument("--rate-limit-rate", type=float, default=0.05, help="fraction of fake 429s")
+    p.add_argument("--baseline-requests", type=int, default=10)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=lambda a: asyncio.run(bench_llm(a)))
+
+    p = sub.add_parser("hybrid", help="dense vs BM25 vs fused retrieval on the ingested corpus")
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--terms", type=int, default=3, help="rare terms per query")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_hybrid)
+
+    p = sub.add_parser("chunking", help="new chunker vs both old ones")
+    p.add_argument("--pdf", help="chunk this PDF instead of a synthetic transcript")
+    p.add_argument("--pages", type=int, default=500)
+    p.add_argument("--tokenizer", help="also time token-aware chunking (HF name or tokenizer.json)")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_chunking)
+
+    p = sub.add_parser("embeddings", help="throughput and cosine parity of embedding backends")
+    p.add_argument("--backends", default="torch,onnx,onnx-int8", help="first one is the parity reference")
+    p.add_argument("--onnx-dir", help="defaults to rag_pipeline.ONNX_MODEL_DIR")
+    p.add_argument("--pages", type=int, default=20)
+    p.add_argument("--batch-size", type=int, default=64)
+    p.add_argument("--min-cosine", type=float, help="override the per-backend parity floor")
+    p.add_argument("--repeat", type=int, default=1)
+    p.set_defaults(func=bench_embeddings)
+
+    p = sub.add_parser("startup", help="cold import time without GEMINI_API_KEY")
+    p.add_argument("--module", default="rag_pipeline")
+    p.add_argument("--runs", type=int, default=5)
+    p.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
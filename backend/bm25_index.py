@@ -0,0 +1,356 @@
+# bm25_index.py
+# On-disk BM25 inverted index over the ingested chunks
+#
+# Ingest writes one small segment per PDF (<pdf>.npz: per-chunk term
+# frequencies), so re-ingesting a changed PDF only re-tokenizes that PDF.
+# The segments are then merged into a single index file that queries
+# memory-map:
+#
+#   header    -> MAGIC, doc count, term count, posting count, avg doc length
+#   lengths   -> u32 per doc (tokens in the chunk)
+#   offsets   -> u64 per term + 1, into the posting arrays
+#   docs      -> u32 per posting, doc numbers sorted within each term
+#   tfs       -> u16 per posting
+#   ids       -> u64 length + "\n"-joined chunk ids
+#   terms     -> u64 length + "\n"-joined terms, sorted
+#
+# Every section starts on an 8-byte boundary so the arrays are read in place.
+
+import os
+import re
+import mmap
+import struct
+import threading
+
+import numpy as np
+
+# ===============================
+# CONSTANTS
+# ===============================
+
+MAGIC = b"SSBM25v1"
+SEGMENT_EXT = ".npz"
+INDEX_FILE = "bm25.idx"
+
+_HEADER = struct.Struct("<8sIIQfI")
+_LEN = struct.Struct("<Q")
+
+K1 = 1.2
+B = 0.75
+
+# Words, numbers and compounds like 25-11-2024, 12/2024, no.45 or covid-19
+_TOKEN = re.compile(r"\w+(?:[-/.]\w+)*")
+_PARTS = re.compile(r"[-/.]")
+MAX_TOKEN_CHARS = 40
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i in is it its "
+    "of on or she that the their them they this to was were which will with "
+    "you your we our not no so if than then there these those been being had "
+    "do does did shall should would can could may might must also into about".split()
+)
+
+# ===============================
+# TOKENIZER
+# ===============================
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased words and numbers, stopwords dropped. Compounds are kept whole
+    and also split, so "25-11-2024" matches both the date and "2024".
+    """
+    out = []
+    for m in _TOKEN.finditer(text.lower()):
+        tok = m.group()[:MAX_TOKEN_CHARS]
+        if tok not in STOPWORDS:
+            out.append(tok)
+        if not tok.isalnum():
+            out.extend(p for p in _PARTS.split(tok) if p and p not in STOPWORDS)
+    return out
+
+# ===============================
+# SEGMENTS (one per PDF)
+# ===============================
+
+def segment_path(index_dir: str, pdf_name: str) -> str:
+    return os.path.join(index_dir, "segments", pdf_name + SEGMENT_EXT)
+
+
+def write_segment(index_dir: str, pdf_name: str, chunks: list[str]):
+    """Term frequencies of every chunk of one PDF, chunk i = posting doc i"""
+    vocab = {}
+    term_ids, docs, tfs, lengths = [], [], [], []
+
+    for i, text in enumerate(chunks):
+        tokens = tokenize(text)
+        lengths.append(len(tokens))
+        counts = {}
+        for t in tokens:
+            counts[t] = counts.get(t, 0) + 1
+        for t, tf in counts.items():
+            term_ids.append(vocab.setdefault(t, len(vocab)))
+            docs.append(i)
+            tfs.append(min(tf, 65535))
+
+    path = segment_path(index_dir, pdf_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(
+            f,
+            terms=np.array(list(vocab) or [""]),
+            term_ids=np.asarray(term_ids, dtype=np.uint32),
+            docs=np.asarray(docs, dtype=np.uint32),
+            tfs=np.asarray(tfs, dtype=np.uint16),
+            lengths=np.asarray(lengths, dtype=np.uint32),
+        )
+    os.replace(tmp, path)
+
+
+def remove_segment(index_dir: str, pdf_name: str):
+    try:
+        os.remove(segment_path(index_dir, pdf_name))
+    except FileNotFoundError:
+        pass
+
+
+def has_segment(index_dir: str, pdf_name: str) -> bool:
+    return os.path.exists(segment_path(index_dir, pdf_name))
+
+# ===============================
+# MERGE
+# ===============================
+
+def _pad(f):
+    f.write(b"\0" * (-f.tell() % 8))
+
+
+def build_index(index_dir: str, pdfs: dict[str, int], chunk_id) -> str:
+    """
+    Merge the segments of `pdfs` (pdf name -> expected chunk count) into the
+    index file; chunk_id(pdf, i) names each doc. Segments whose chunk count
+    doesn't match (half-finished ingest) are left out.
+    """
+    vocab = {}
+    ids, lengths = [], []
+    parts = []  # (global term ids, docs, tfs)
+
+    for pdf in sorted(pdfs):
+        path = segment_path(index_dir, pdf)
+        if not os.path.exists(path):
+            continue
+        with np.load(path) as seg:
+            if len(seg["lengths"]) != pdfs[pdf]:
+                continue
+            local = seg["terms"].tolist() if len(seg["term_ids"]) else []
+            remap = np.asarray([vocab.setdefault(t, len(vocab)) for t in local], dtype=np.uint32)
+            base = len(ids)
+            if len(seg["term_ids"]):
+                parts.append((remap[seg["term_ids"]], seg["docs"] + np.uint32(base), seg["tfs"]))
+            lengths.append(seg["lengths"])
+            ids.extend(chunk_id(pdf, i) for i in range(len(seg["lengths"])))
+
+    terms = sorted(vocab)
+    # Renumber term ids so they follow sorted term order
+    rank = np.empty(len(vocab), dtype=np.uint32)
+    rank[[vocab[t] for t in terms]] = np.arange(len(terms), dtype=np.uint32)
+
+    if parts:
+        term_col = rank[np.concatenate([p[0] for p in parts])]
+        docs = np.concatenate([p[1] for p in parts])
+        tfs = np.concatenate([p[2] for p in parts])
+        order = np.lexsort((docs, term_col))
+        term_col, docs, tfs = term_col[order], docs[order], tfs[order]
+    else:
+        term_col = np.zeros(0, dtype=np.uint32)
+        docs = np.zeros(0, dtype=np.uint32)
+        tfs = np.zeros(0, dtype=np.uint16)
+
+    lengths = np.concatenate(lengths).astype(np.uint32) if lengths else np.zeros(0, dtype=np.uint32)
+    offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum(np.bincount(term_col, minlength=len(terms)))
+    avgdl = float(lengths.mean()) if len(lengths) else 0.0
+
+    path = os.path.join(index_dir, INDEX_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(ids), len(terms), len(docs), avgdl, 0))
+        for arr in (lengths, offsets, docs.astype(np.uint32), tfs.astype(np.uint16)):
+            _pad(f)
+            f.write(arr.tobytes())
+        for blob in ("\n".join(ids).encode("utf-8"), "\n".join(terms).encode("utf-8")):
+            _pad(f)
+            f.write(_LEN.pack(len(blob)))
+            f.write(blob)
+    os.replace(tmp, path)
+    return path
+
+# ===============================
+# READER
+# ===============================
+
+class BM25Index:
+    """Memory-mapped index; search() scores every matching doc with NumPy"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mtime = os.stat(path).st_mtime_ns
+
+        magic, n_docs, n_terms, n_postings, avgdl, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"Not a BM25 index: {path}")
+
+        pos = _HEADER.size
+
+        def array(dtype, count):
+            nonlocal pos
+            pos += -pos % 8
+            arr = np.frombuffer(self._mm, dtype=dtype, count=count, offset=pos)
+            pos += arr.nbytes
+            return arr
+
+        def blob():
+            nonlocal pos
+            pos += -pos % 8
+            (size,) = _LEN.unpack_from(self._mm, pos)
+            pos += _LEN.size
+            text = self._mm[pos:pos + size].decode("utf-8")
+            pos += size
+            return text.split("\n") if text else []
+
+        self.lengths = array("<u4", n_docs)
+        self.offsets = array("<u8", n_terms + 1)
+        self.docs = array("<u4", n_postings)
+        self.tfs = array("<u2", n_postings)
+        self.ids = blob()
+        self.terms = {t: i for i, t in enumerate(blob())}
+        self.avgdl = avgdl or 1.0
+        # Per-doc length normalization, the part of BM25 that doesn't depend on the query
+        self.norm = K1 * (1 - B + B * self.lengths.astype(np.float32) / self.avgdl)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query: str, k=10) -> list[tuple[str, float]]:
+        """Top-k (chunk id, score), best first"""
+        n = len(self.ids)
+        if not n:
+            return []
+
+        scores = np.zeros(n, dtype=np.float32)
+
+        for term in set(tokenize(query)):
+            t = self.terms.get(term)
+            if t is None:
+                continue
+            start, stop = int(self.offsets[t]), int(self.offsets[t + 1])
+            docs = self.docs[start:stop]
+            tf = self.tfs[start:stop].astype(np.float32)
+            df = stop - start
+            idf = np.log1p((n - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tf * (K1 + 1) / (tf + self.norm[docs])
+
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        top = hits[np.argsort(-scores[hits], kind="stable")[:k]]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    def close(self):
+        # Arrays view the map; drop them before closing it
+        self.lengths = self.offsets = self.docs = self.tfs = self.norm = None
+        self._mm.close()
+
+
+class IndexHandle:
+    """
+    The current BM25Index, reopened when ingest replaces the file. A replaced
+    index is closed once the last search() still using it returns.
+    """
+
+    def __init__(self, index_dir: str):
+        self.path = os.path.join(index_dir, INDEX_FILE)
+        self._index = None
+        self._lock = threading.Lock()
+        # index -> searches currently running on it
+        self._users = {}
+
+    def _retire(self, index: BM25Index):
+        # Called with self._lock held
+        if index is not self._index and not self._users.get(index):
+            self._users.pop(index, None)
+            index.close()
+
+    def get(self) -> BM25Index | None:
+        """Current index, for single-threaded use (bench, ingest checks)"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if self._index is None or self._index.mtime != mtime:
+                old, self._index = self._index, BM25Index(self.path)
+                if old is not None:
+                    self._retire(old)
+            return self._index
+
+    def search(self, query: str, k=10) -> list[tuple[str, float]]:
+        """BM25Index.search on the current index, safe alongside reopens"""
+        while True:
+            index = self.get()
+            if index is None:
+                return []
+            with self._lock:
+                if index.lengths is not None:
+                    self._users[index] = self._users.get(index, 0) + 1
+                    break
+            # Swapped out and closed between get() and the lock; try again
+        try:
+            return index.search(query, k)
+        finally:
+            with self._lock:
+                self._users[index] -= 1
+                self._retire(index)
+
+# ===============================
+# FUSION
+# ===============================
+
+def rrf(rankings: list[list[str]], k=60, limit=None) -> list[tuple[str, float]]:
+    """Reciprocal rank fusion of several best-first id lists"""
+    scores = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank + 1)
+    fused = sorted(scores.items(), key=lambda kv: -kv[1])
+    return fused[:limit] if limit else fused
+
+# ===============================
+# STATS
+# ===============================
+
+class HybridStats:
+    """Running totals of hybrid searches, BM25 budget misses and keyword-only hits"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.bm25_timeouts = 0
+        self.bm25_only_hits = 0
+
+    def add(self, timed_out=False, bm25_only_hits=0):
+        with self._lock:
+            self.queries += 1
+            self.bm25_timeouts += int(timed_out)
+            self.bm25_only_hits += bm25_only_hits
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "bm25_timeouts": self.bm25_timeouts,
+                "bm25_only_hits": self.bm25_only_hits,
+            }
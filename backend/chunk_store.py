@@ -0,0 +1,289 @@
+# chunk_store.py
+# One segment file per PDF instead of one .txt file per chunk
+#
+# Segment layout (little endian):
+#   MAGIC
+#   record*   -> u32 length + utf-8 bytes
+#   index     -> u64 offset of each record
+#   trailer   -> u64 index offset, u32 record count, MAGIC
+#
+# Chunk ids keep the "<pdf filename>.chunk<i>.txt" form of the old one-file-
+# per-chunk layout, so ids already handed out (n8n / Sheets) still resolve.
+#
+# ChunkStore reads with seek + read; MappedChunkStore memory-maps segments
+# and hands out memoryview slices for bulk, read-only passes (re-embedding,
+# export) without a syscall or copy per chunk.
+
+import os
+import sys
+import mmap
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+
+# ===============================
+# CONSTANTS
+# ===============================
+
+MAGIC = b"SSCHUNK1"
+SEGMENT_EXT = ".chunks"
+
+_LEN = struct.Struct("<I")
+_OFFSET = struct.Struct("<Q")
+_TRAILER = struct.Struct("<QI8s")
+
+# ===============================
+# IDS
+# ===============================
+
+def chunk_id(pdf_name: str, i: int) -> str:
+    return f"{pdf_name}.chunk{i}.txt"
+
+
+def parse_chunk_id(cid: str) -> tuple[str, int]:
+    """'<pdf>.chunk<i>.txt' -> ('<pdf>', i); the '.txt' is optional"""
+    if cid.endswith(".txt"):
+        cid = cid[:-4]
+    pdf_name, sep, i = cid.rpartition(".chunk")
+    if not sep or not i.isdigit():
+        raise KeyError(f"Not a chunk id: {cid}")
+    return pdf_name, int(i)
+
+
+def segment_path(chunk_dir: str, pdf_name: str) -> str:
+    return os.path.join(chunk_dir, pdf_name + SEGMENT_EXT)
+
+# ===============================
+# WRITER
+# ===============================
+
+def write_segment(chunk_dir: str, pdf_name: str, chunks: list[str]) -> list[str]:
+    """
+    Write every chunk of a PDF with a single sequential write (via temp file
+    + rename, so readers never see a half-written segment). Returns chunk ids.
+    """
+    parts = [MAGIC]
+    offsets = []
+    pos = len(MAGIC)
+
+    for c in chunks:
+        data = c.encode("utf-8")
+        offsets.append(pos)
+        parts.append(_LEN.pack(len(data)))
+        parts.append(data)
+        pos += _LEN.size + len(data)
+
+    parts.append(b"".join(_OFFSET.pack(o) for o in offsets))
+    parts.append(_TRAILER.pack(pos, len(offsets), MAGIC))
+
+    path = segment_path(chunk_dir, pdf_name)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"".join(parts))
+    os.replace(tmp, path)
+
+    return [chunk_id(pdf_name, i) for i in range(len(chunks))]
+
+# ===============================
+# READER
+# ===============================
+
+class SegmentClosed(Exception):
+    """The reader was closed (evicted from a ChunkStore) while in use"""
+
+
+class SegmentReader:
+    """Loads the offset index once; each chunk read is then one seek + read"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "rb")
+        self._lock = threading.Lock()
+
+        self._f.seek(-_TRAILER.size, os.SEEK_END)
+        index_offset, count, magic = _TRAILER.unpack(self._f.read(_TRAILER.size))
+        if magic != MAGIC:
+            self._f.close()
+            raise ValueError(f"Not a chunk segment: {path}")
+
+        self._f.seek(index_offset)
+        raw = self._f.read(count * _OFFSET.size)
+        self.offsets = [o for (o,) in _OFFSET.iter_unpack(raw)]
+        # Record i ends where i+1 starts; the last one ends at the index
+        self.ends = self.offsets[1:] + [index_offset]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def read_bytes(self, i: int) -> bytes:
+        start = self.offsets[i] + _LEN.size
+        with self._lock:
+            if self._f.closed:
+                raise SegmentClosed(self.path)
+            self._f.seek(start)
+            return self._f.read(self.ends[i] - start)
+
+    def get(self, i: int) -> str:
+        return self.read_bytes(i).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get(i)
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+
+class ChunkStore:
+    """Chunk lookup by id, keeping the most recently used segments open"""
+
+    def __init__(self, chunk_dir: str, max_open=64):
+        self.chunk_dir = chunk_dir
+        self.max_open = max_open
+        self._readers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def segment(self, pdf_name: str) -> SegmentReader:
+        with self._lock:
+            reader = self._readers.get(pdf_name)
+            if reader is not None:
+                self._readers.move_to_end(pdf_name)
+                return reader
+
+            reader = SegmentReader(segment_path(self.chunk_dir, pdf_name))
+            self._readers[pdf_name] = reader
+            if len(self._readers) > self.max_open:
+                _, oldest = self._readers.popitem(last=False)
+                oldest.close()
+            return reader
+
+    def get(self, cid: str) -> str:
+        pdf_name, i = parse_chunk_id(cid)
+
+        if not os.path.exists(segment_path(self.chunk_dir, pdf_name)):
+            # Chunks written before segments existed
+            legacy = os.path.join(self.chunk_dir, f"{pdf_name}.chunk{i}.txt")
+            if os.path.exists(legacy):
+                with open(legacy, "r", encoding="utf-8") as f:
+                    return f.read()
+            raise KeyError(cid)
+
+        while True:
+            try:
+                return self.segment(pdf_name).get(i)
+            except SegmentClosed:
+                # Evicted between lookup and read; fetch it again so the
+                # reopened file is tracked (and eventually closed) by the LRU
+                continue
+            except IndexError:
+                raise KeyError(cid) from None
+
+    def close(self):
+        with self._lock:
+            for reader in self._readers.values():
+                reader.close()
+            self._readers.clear()
+
+
+# ===============================
+# MEMORY-MAPPED READER
+# ===============================
+
+class MappedSegment:
+    """
+    Read-only mmap of one segment. view(i) is a zero-copy memoryview of the
+    chunk's UTF-8 bytes; text(i) decodes it on demand. Views keep the map
+    alive, so release them before close().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mm)
+
+        index_offset, count, magic = _TRAILER.unpack_from(self._mm, len(self._mm) - _TRAILER.size)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not a chunk segment: {path}")
+
+        offsets = array("Q")
+        offsets.frombytes(self._buf[index_offset:index_offset + count * _OFFSET.size])
+        if sys.byteorder != "little":
+            offsets.byteswap()
+
+        self.offsets = offsets
+        self.index_offset = index_offset
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def view(self, i: int) -> memoryview:
+        start = self.offsets[i] + _LEN.size
+        end = self.offsets[i + 1] if i + 1 < len(self.offsets) else self.index_offset
+        return self._buf[start:end]
+
+    def text(self, i: int) -> str:
+        return str(self.view(i), "utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.view(i)
+
+    def close(self):
+        self._buf.release()
+        self._mm.close()
+
+
+class MappedChunkStore:
+    """Memory-mapped, read-only view over every segment in a chunk directory"""
+
+    def __init__(self, chunk_dir: str):
+        self.chunk_dir = chunk_dir
+        self._segments = {}
+        self._lock = threading.Lock()
+
+    def segment(self, pdf_name: str) -> MappedSegment:
+        seg = self._segments.get(pdf_name)
+        if seg is None:
+            with self._lock:
+                seg = self._segments.get(pdf_name)
+                if seg is None:
+                    seg = MappedSegment(segment_path(self.chunk_dir, pdf_name))
+                    self._segments[pdf_name] = seg
+        return seg
+
+    def view(self, cid: str) -> memoryview:
+        pdf_name, i = parse_chunk_id(cid)
+        try:
+            return self.segment(pdf_name).view(i)
+        except (FileNotFoundError, IndexError):
+            raise KeyError(cid) from None
+
+    def get(self, cid: str) -> str:
+        return str(self.view(cid), "utf-8")
+
+    def pdf_names(self) -> list[str]:
+        return sorted(
+            f[:-len(SEGMENT_EXT)] for f in os.listdir(self.chunk_dir)
+            if f.endswith(SEGMENT_EXT)
+        )
+
+    def iter_views(self):
+        """Yield (chunk_id, memoryview) for the whole corpus, segment by segment"""
+        for pdf_name in self.pdf_names():
+            seg = self.segment(pdf_name)
+            for i in range(len(seg)):
+                yield chunk_id(pdf_name, i), seg.view(i)
+
+    def iter_texts(self):
+        for cid, view in self.iter_views():
+            yield cid, str(view, "utf-8")
+
+    def close(self):
+        with self._lock:
+            for seg in self._segments.values():
+                seg.close()
+            self._segments.clear()
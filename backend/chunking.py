@@ -0,0 +1,246 @@
+# chunking.py
+# Chunker shared by ingest_service and rag_pipeline
+#
+# Chunks are character spans into the original text. Word boundaries come
+# from one vectorized NumPy pass over the code points; chunk text is only
+# sliced out when asked for, whitespace is left as it was, and each span
+# knows which pages it came from.
+
+from typing import NamedTuple
+
+import numpy as np
+
+# Every code point str.split() treats as whitespace, i.e.
+# [c for c in range(sys.maxunicode + 1) if chr(c).isspace()]
+# spelled out so importing this module doesn't scan all of Unicode
+_WHITESPACE = np.array(
+    [9, 10, 11, 12, 13, 28, 29, 30, 31, 32, 133, 160, 5760,
+     8192, 8193, 8194, 8195, 8196, 8197, 8198, 8199, 8200, 8201, 8202,
+     8232, 8233, 8239, 8287, 12288],
+    dtype=np.uint32,
+)
+
+PAGE_SEP = "\n"
+
+# ===============================
+# TYPES
+# ===============================
+
+class Chunk(NamedTuple):
+    start: int
+    end: int
+    # 0-based pages the span starts and ends on; None when pages are unknown
+    page: int | None = None
+    last_page: int | None = None
+
+
+class ChunkedText:
+    """Text plus its chunk spans; indexing slices the chunk out on demand"""
+
+    def __init__(self, text: str, chunks: list[Chunk]):
+        self.text = text
+        self.chunks = chunks
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __getitem__(self, i: int) -> str:
+        c = self.chunks[i]
+        return self.text[c.start:c.end]
+
+    def __iter__(self):
+        for c in self.chunks:
+            yield self.text[c.start:c.end]
+
+    def texts(self) -> list[str]:
+        return list(self)
+
+# ===============================
+# HELPERS
+# ===============================
+
+def join_pages(pages: list[str], sep=PAGE_SEP) -> tuple[str, list[int]]:
+    """Join page texts, returning the text and each page's start offset"""
+    starts = []
+    pos = 0
+    for p in pages:
+        starts.append(pos)
+        pos += len(p) + len(sep)
+    return sep.join(pages), starts
+
+
+def word_bounds(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """Start and end offsets of every whitespace-separated word"""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    is_word = ~np.isin(codes, _WHITESPACE)
+
+    # +1 where a word starts, -1 one past where it ends
+    edges = np.diff(is_word.astype(np.int8), prepend=np.int8(0), append=np.int8(0))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _with_pages(starts, ends, page_starts):
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    if not page_starts:
+        return [Chunk(s, e) for s, e in zip(starts.tolist(), ends.tolist())]
+
+    page_starts = np.asarray(page_starts)
+    first = np.searchsorted(page_starts, starts, side="right") - 1
+    last = np.searchsorted(page_starts, ends - 1, side="right") - 1
+    return [
+        Chunk(*row) for row in zip(starts.tolist(), ends.tolist(), first.tolist(), last.tolist())
+    ]
+
+# ===============================
+# CHUNKERS
+# ===============================
+
+def chunk_by_words(text: str, target_words=400, overlap=0.2, page_starts=None) -> list[Chunk]:
+    """
+    Windows of `target_words` words, each starting `target_words * (1 - overlap)`
+    words after the previous one (same boundaries as the old word chunker).
+    """
+    starts, ends = word_bounds(text)
+    n = len(starts)
+    if not n:
+        return []
+
+    step = int(target_words * (1 - overlap)) or target_words
+    first = np.arange(0, n, step)
+    last = np.minimum(first + target_words, n) - 1
+    return _with_pages(starts[first], ends[last], page_starts)
+
+
+def chunk_by_chars(text: str, chunk_size=1200, page_starts=None) -> list[Chunk]:
+    """
+    Greedy spans of at most `chunk_size` characters that end on a word
+    boundary; a single word longer than that is split.
+    """
+    starts, ends = word_bounds(text)
+    n = len(starts)
+    span_starts, span_ends = [], []
+    i = 0
+    pos = int(starts[0]) if n else 0
+
+    while i < n:
+        limit = pos + chunk_size
+        # Last word that ends within the limit
+        j = int(np.searchsorted(ends, limit, side="right")) - 1
+
+        if j < i:
+            # Word longer than chunk_size: hard split it
+            span_starts.append(pos)
+            span_ends.append(limit)
+            pos = limit
+            if pos >= ends[i]:
+                i += 1
+                pos = int(starts[i]) if i < n else pos
+            continue
+
+        span_starts.append(pos)
+        span_ends.append(int(ends[j]))
+        i = j + 1
+        pos = int(starts[i]) if i < n else pos
+
+    return _with_pages(span_starts, span_ends, page_starts)
+
+
+def chunk_by_tokens(text: str, tokenizer, max_tokens=254, overlap_tokens=0, page_starts=None) -> list[Chunk]:
+    """
+    Spans of at most `max_tokens` tokens of `tokenizer` (a `tokenizers.Tokenizer`,
+    special tokens not counted), so nothing gets truncated when the chunk is
+    embedded. Spans end on a word boundary unless one word alone is too long.
+    Pages are tokenized together in one encode_batch call.
+    """
+    if page_starts:
+        bounds = list(page_starts) + [len(text) + 1]
+        pieces = [text[bounds[k]:bounds[k + 1] - 1] for k in range(len(page_starts))]
+        bases = list(page_starts)
+    else:
+        pieces, bases = [text], [0]
+
+    tok_starts, tok_ends, words = [], [], []
+    word_base = 0
+    for base, enc in zip(bases, tokenizer.encode_batch(pieces, add_special_tokens=False)):
+        if not enc.offsets:
+            continue
+        offsets = np.asarray(enc.offsets, dtype=np.int64)
+        word_ids = np.asarray([-1 if w is None else w for w in enc.word_ids], dtype=np.int64)
+        tok_starts.append(offsets[:, 0] + base)
+        tok_ends.append(offsets[:, 1] + base)
+        # Word ids restart on every page; keep them distinct across pages
+        words.append(word_ids + word_base)
+        word_base += int(word_ids.max()) + 1
+
+    if not tok_starts:
+        return []
+
+    tok_starts = np.concatenate(tok_starts)
+    tok_ends = np.concatenate(tok_ends)
+    words = np.concatenate(words)
+    n = len(tok_starts)
+
+    # new_word[k]: token k starts a word, so a span may begin/end right before it
+    new_word = np.ones(n + 1, dtype=bool)
+    new_word[1:n] = words[1:] != words[:-1]
+    word_starts = np.flatnonzero(new_word)
+
+    def back_to_word_start(k: int, floor: int) -> int:
+        w = int(word_starts[np.searchsorted(word_starts, k, side="right") - 1])
+        return w if w > floor else k
+
+    # Token offsets skip what the normalizer strips (e.g. Devanagari matras,
+    # anusvara and virama once accents are removed), so a span runs on to the
+    # end of its last whitespace word, never past the next span's first token
+    ws_starts, ws_ends = word_bounds(text)
+
+    def span_end(j: int) -> int:
+        end = int(tok_ends[j - 1])
+        w = int(np.searchsorted(ws_starts, end - 1, side="right")) - 1
+        if w >= 0:
+            end = max(end, int(ws_ends[w]))
+        return min(end, int(tok_starts[j])) if j < n else end
+
+    span_starts, span_ends = [], []
+    i = 0
+    while i < n:
+        j = min(i + max_tokens, n)
+        if j < n:
+            j = back_to_word_start(j, i)
+
+        span_starts.append(int(tok_starts[i]))
+        span_ends.append(span_end(j))
+
+        if j >= n:
+            break
+        nxt = j - overlap_tokens if overlap_tokens else j
+        i = back_to_word_start(nxt, i) if nxt > i else j
+
+    return _with_pages(span_starts, span_ends, page_starts)
+
+
+def detached_tokenizer(tokenizer):
+    """
+    Independent copy of a `tokenizers.Tokenizer` (e.g. a SentenceTransformer's
+    backend tokenizer) with truncation and padding off, safe to use for
+    chunking alongside the model.
+    """
+    from tokenizers import Tokenizer
+
+    tok = Tokenizer.from_str(tokenizer.to_str())
+    tok.no_truncation()
+    tok.no_padding()
+    return tok
+
+
+def chunk_pages(pages: list[str], chunker=chunk_by_words, **kwargs) -> ChunkedText:
+    """Join pages and chunk them with page provenance attached"""
+    text, page_starts = join_pages(pages)
+    return ChunkedText(text, chunker(text, page_starts=page_starts, **kwargs))
+
+
+def chunk_text(text: str, chunker=chunk_by_words, **kwargs) -> ChunkedText:
+    return ChunkedText(text, chunker(text, **kwargs))
+
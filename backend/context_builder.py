@@ -0,0 +1,178 @@
+# context_builder.py
+# Turns retrieved chunks into the context block of the RAG prompt
+#
+# Retrieved chunks often overlap (CHUNK_OVERLAP_TOKENS) or sit next to each
+# other in the same PDF. Chunks carry their character span in the PDF's
+# joined text (metadata "start"/"end"), so overlapping or touching chunks of
+# one source are stitched back into a single passage, exact duplicates are
+# dropped, and passages are packed best-first into a token budget.
+
+import threading
+from typing import NamedTuple
+
+# Chunks of one source this many characters apart or closer are merged
+MERGE_GAP = 2
+
+# ===============================
+# TYPES
+# ===============================
+
+class Passage(NamedTuple):
+    source: str | None
+    text: str
+    # Best (lowest) distance among the merged chunks
+    distance: float
+    ids: list[str]
+    page: int | None = None
+    last_page: int | None = None
+
+
+class PackedContext(NamedTuple):
+    text: str
+    passages: list[Passage]
+    tokens: int
+    # What joining every retrieved chunk verbatim would have cost
+    naive_tokens: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.naive_tokens - self.tokens
+
+# ===============================
+# MERGING
+# ===============================
+
+def _stitch(group: list[tuple]) -> str:
+    """Texts of chunks sorted by start, with overlapping parts kept once"""
+    text, end = "", None
+    for start, stop, doc in group:
+        if end is None:
+            text = doc
+        elif start >= end:
+            text += ("\n" if start > end else "") + doc
+        elif stop > end:
+            text += doc[end - start:]
+        end = stop if end is None else max(end, stop)
+    return text
+
+
+def merge_chunks(ids, documents, metadatas, distances) -> list[Passage]:
+    """Drop duplicate chunks and merge overlapping / adjacent ones per source"""
+    seen = set()
+    by_source = {}
+    loose = []
+
+    for cid, doc, meta, dist in zip(ids, documents, metadatas or [{}] * len(ids), distances):
+        if doc in seen:
+            continue
+        seen.add(doc)
+
+        meta = meta or {}
+        if meta.get("start") is None or meta.get("end") is None:
+            # Chunks ingested before spans were stored can only be deduplicated
+            loose.append(Passage(meta.get("source"), doc, dist, [cid], meta.get("page"), meta.get("last_page")))
+            continue
+        by_source.setdefault(meta.get("source"), []).append((meta["start"], meta["end"], doc, cid, dist, meta))
+
+    passages = []
+    for source, chunks in by_source.items():
+        chunks.sort(key=lambda c: c[0])
+        group = [chunks[0]]
+        for c in chunks[1:]:
+            if c[0] <= max(g[1] for g in group) + MERGE_GAP:
+                group.append(c)
+                continue
+            passages.append(_passage(source, group))
+            group = [c]
+        passages.append(_passage(source, group))
+
+    return sorted(passages + loose, key=lambda p: p.distance)
+
+
+def _passage(source, group) -> Passage:
+    pages = [g[5].get("page") for g in group if g[5].get("page") is not None]
+    last_pages = [g[5].get("last_page") for g in group if g[5].get("last_page") is not None]
+    return Passage(
+        source,
+        _stitch([(g[0], g[1], g[2]) for g in group]),
+        min(g[4] for g in group),
+        [g[3] for g in group],
+        min(pages) if pages else None,
+        max(last_pages) if last_pages else None,
+    )
+
+# ===============================
+# PACKING
+# ===============================
+
+def _truncate(text: str, budget: int, count_tokens) -> str:
+    """Longest prefix of `text` within `budget` tokens (binary search on length)"""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens([text[:mid]])[0] <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def build_context(ids, documents, metadatas, distances, count_tokens, budget=1500) -> PackedContext:
+    """
+    Merge the retrieved chunks into passages and add them most relevant first
+    while they fit in `budget` tokens (as counted by count_tokens(list[str])
+    -> list[int]). The most relevant passage is always included, cut down
+    to the budget if it is longer on its own.
+    """
+    passages = merge_chunks(ids, documents, metadatas, distances)
+    naive_tokens = sum(count_tokens(list(documents))) if documents else 0
+
+    blocks = [p.text for p in passages]
+    sizes = count_tokens(blocks) if blocks else []
+
+    chosen, used = [], 0
+    for p, block, size in zip(passages, blocks, sizes):
+        if used + size <= budget:
+            chosen.append((p, block))
+            used += size
+        elif not chosen:
+            block = _truncate(block, budget, count_tokens)
+            chosen.append((p, block))
+            used = count_tokens([block])[0]
+
+    return PackedContext(
+        "\n\n".join(block for _, block in chosen),
+        [p for p, _ in chosen],
+        used,
+        naive_tokens,
+    )
+
+# ===============================
+# STATS
+# ===============================
+
+class ContextStats:
+    """Running totals of prompt context tokens, packed vs verbatim"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.tokens = 0
+        self.naive_tokens = 0
+
+    def add(self, packed: PackedContext):
+        with self._lock:
+            self.queries += 1
+            self.tokens += packed.tokens
+            self.naive_tokens += packed.naive_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            saved = self.naive_tokens - self.tokens
+            return {
+                "queries": self.queries,
+                "tokens": self.tokens,
+                "tokens_saved": saved,
+                "saved_per_query": round(saved / self.queries, 1) if self.queries else 0.0,
+                "saved_ratio": round(saved / self.naive_tokens, 3) if self.naive_tokens else 0.0,
+            }
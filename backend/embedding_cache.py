@@ -0,0 +1,209 @@
+# embedding_cache.py
+# Disk-backed embedding cache keyed by (model, normalized chunk text)
+#
+# Layout of a cache directory:
+#   vectors.bin -> fixed-size rows of float16 (or float32), one per slot
+#   index.db    -> SQLite: key -> slot + last use time, plus dim/dtype/slot count
+#
+# Keys are the first 16 bytes of sha256(model name + NUL + text with
+# whitespace runs collapsed), so re-chunking that only moves line breaks
+# still hits. Once the row file reaches its size limit, new entries take
+# the slots of the least recently used ones.
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+# ===============================
+# KEYS
+# ===============================
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(model_name: str, text: str) -> bytes:
+    data = model_name.encode("utf-8") + b"\0" + normalize_text(text).encode("utf-8")
+    return hashlib.sha256(data).digest()[:16]
+
+# ===============================
+# CACHE
+# ===============================
+
+class EmbeddingCache:
+    """
+    lookup(texts) -> cached vectors (None where missing); store(texts, vectors)
+    after encoding the misses. Safe to share between threads.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, max_mb=512, dtype="float16"):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(cache_dir, "vectors.bin")
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, "index.db"),
+            timeout=30, isolation_level=None, check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key BLOB PRIMARY KEY,"
+            " slot INTEGER NOT NULL,"
+            " last_used REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+        meta = dict(self._conn.execute("SELECT name, value FROM meta"))
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        if meta.get("dtype", self.dtype.name) != self.dtype.name:
+            self.clear()
+
+        self._f = open(self._vectors_path, "r+b" if os.path.exists(self._vectors_path) else "w+b")
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    @property
+    def capacity(self) -> int:
+        return max(1, self.max_bytes // self.row_bytes) if self.dim else 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM meta")
+            self.dim = None
+            if hasattr(self, "_f"):
+                self._f.truncate(0)
+
+    # ---- Reads ----
+
+    def lookup(self, texts: list[str]) -> list[np.ndarray | None]:
+        """float32 vector per text, or None for the ones not cached"""
+        keys = [cache_key(self.model_name, t) for t in texts]
+        out = [None] * len(texts)
+
+        with self._lock:
+            slots = {}
+            for start in range(0, len(keys), 500):
+                part = list(set(keys[start:start + 500]))
+                marks = ",".join("?" * len(part))
+                slots.update(self._conn.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({marks})", part
+                ))
+
+            if slots:
+                rows = {}
+                for slot in sorted(set(slots.values())):
+                    self._f.seek(slot * self.row_bytes)
+                    rows[slot] = np.frombuffer(self._f.read(self.row_bytes), dtype=self.dtype)
+
+                for i, key in enumerate(keys):
+                    slot = slots.get(key)
+                    if slot is not None:
+                        out[i] = rows[slot].astype(np.float32)
+
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in slots],
+                )
+
+            found = sum(v is not None for v in out)
+            self.hits += found
+            self.misses += len(out) - found
+        return out
+
+    # ---- Writes ----
+
+    def store(self, texts: list[str], vectors: np.ndarray):
+        """Cache freshly computed vectors, evicting least recently used entries when full"""
+        vectors = np.asarray(vectors)
+        if not len(texts):
+            return
+
+        # Last write wins for repeated texts within a batch
+        new = dict(zip((cache_key(self.model_name, t) for t in texts), range(len(texts))))
+
+        with self._lock:
+            conn = self._conn
+
+            # Claim slots first and commit, so no indexed key ever points at a
+            # row that is being overwritten; a crash mid-write only leaks slots
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                        [("dim", str(self.dim)), ("dtype", self.dtype.name), ("slots", "0")],
+                    )
+                elif vectors.shape[1] != self.dim:
+                    raise ValueError(f"Cached vectors have dim {self.dim}, got {vectors.shape[1]}")
+
+                marks = ",".join("?" * len(new))
+                existing = {k for (k,) in conn.execute(f"SELECT key FROM entries WHERE key IN ({marks})", list(new))}
+                keys = [k for k in new if k not in existing][:self.capacity]
+
+                used = int(conn.execute("SELECT value FROM meta WHERE name = 'slots'").fetchone()[0])
+                slots = list(range(used, min(used + len(keys), self.capacity)))
+                conn.execute("UPDATE meta SET value = ? WHERE name = 'slots'", (str(used + len(slots)),))
+
+                if len(slots) < len(keys):
+                    victims = conn.execute(
+                        "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?",
+                        (len(keys) - len(slots),),
+                    ).fetchall()
+                    conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims])
+                    slots += [slot for _, slot in victims]
+                    keys = keys[:len(slots)]
+
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+            if not keys:
+                return
+
+            rows = vectors[[new[k] for k in keys]].astype(self.dtype)
+            for slot, row in zip(slots, rows):
+                self._f.seek(slot * self.row_bytes)
+                self._f.write(row.tobytes())
+            self._f.flush()
+
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                [(k, s, now) for k, s in zip(keys, slots)],
+            )
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+            self._conn.close()
@@ -0,0 +1,219 @@
+# embeddings.py
+# Pluggable sentence-embedding backends for rag_pipeline
+#
+#   torch      -> SentenceTransformer.encode (the original path)
+#   onnx       -> the same MiniLM exported to ONNX, run with onnxruntime
+#   onnx-int8  -> that ONNX graph with int8 dynamically-quantized weights
+#
+# Every backend exposes the same small surface: name, max_seq_length,
+# tokenizer (a `tokenizers.Tokenizer`) and encode(texts) -> (n, dim) float32,
+# so the rest of the pipeline doesn't care which one it got.
+#
+# Export once (needs torch + sentence-transformers), then copy the directory
+# to CPU-only hosts:
+#   python embeddings.py export [--model all-MiniLM-L6-v2] [--out models/all-MiniLM-L6-v2-onnx]
+
+import os
+import json
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# onnxruntime intra-op threads; 0 lets it pick (one per physical core)
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "embedder.json"
+
+# ===============================
+# PYTORCH
+# ===============================
+
+class TorchEmbedder:
+    """SentenceTransformer on whatever device torch picks"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.name = f"{model_name}/torch"
+        self.max_seq_length = self.model.max_seq_length
+        self.tokenizer = self.model.tokenizer.backend_tokenizer
+
+    def encode(self, texts: list[str], batch_size=64) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        ).astype(np.float32, copy=False)
+
+# ===============================
+# ONNX RUNTIME
+# ===============================
+
+class OnnxEmbedder:
+    """
+    Exported transformer run by onnxruntime on the CPU, with the model's
+    pooling and normalization redone in NumPy. Texts are tokenized once
+    and batched by length so short chunks aren't padded up to long ones.
+    """
+
+    def __init__(self, model_dir: str, quantized=False):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE), "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+        self.name = f"{config['model_name']}/{'onnx-int8' if quantized else 'onnx'}"
+        self.max_seq_length = config["max_seq_length"]
+        self.pooling = config["pooling"]
+        self.normalize = config["normalize"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(self.max_seq_length)
+        self.pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS:
+            opts.intra_op_num_threads = ONNX_THREADS
+
+        path = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _run(self, encodings) -> np.ndarray:
+        width = max(len(e.ids) for e in encodings)
+        ids = np.full((len(encodings), width), self.pad_id, dtype=np.int64)
+        mask = np.zeros((len(encodings), width), dtype=np.int64)
+        for row, e in enumerate(encodings):
+            ids[row, :len(e.ids)] = e.ids
+            mask[row, :len(e.ids)] = 1
+
+        feed = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feed["token_type_ids"] = np.zeros_like(ids)
+
+        hidden = self.session.run(None, feed)[0]
+
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            m = mask[:, :, None].astype(hidden.dtype)
+            pooled = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+
+        if self.normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32, copy=False)
+
+    def encode(self, texts: list[str], batch_size=64) -> np.ndarray:
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size)[0]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        encodings = self.tokenizer.encode_batch(list(texts))
+        order = np.argsort([len(e.ids) for e in encodings], kind="stable")
+
+        out = None
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            vecs = self._run([encodings[r] for r in rows])
+            if out is None:
+                out = np.empty((len(texts), vecs.shape[1]), dtype=np.float32)
+            out[rows] = vecs
+        return out
+
+# ===============================
+# EXPORT
+# ===============================
+
+def export_onnx(model_name: str, out_dir: str, quantize=True):
+    """
+    Export a SentenceTransformer's transformer to ONNX (+ an int8 copy),
+    along with its tokenizer and the pooling settings OnnxEmbedder needs.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    pooling = next((m for m in st if type(m).__name__ == "Pooling"), None)
+    normalize = any(type(m).__name__ == "Normalize" for m in st)
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    sample = st.tokenizer(["export sample"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic = {n: {0: "batch", 1: "seq"} for n in names + ["last_hidden_state"]}
+
+    onnx_path = os.path.join(out_dir, ONNX_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[n] for n in names),
+            onnx_path,
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=17,
+            dynamo=False,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(onnx_path, os.path.join(out_dir, ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+
+    st.tokenizer.backend_tokenizer.save(os.path.join(out_dir, TOKENIZER_FILE))
+
+    config = {
+        "model_name": model_name,
+        "max_seq_length": st.max_seq_length,
+        "pooling": "cls" if pooling is not None and pooling.pooling_mode_cls_token else "mean",
+        "normalize": normalize,
+    }
+    with open(os.path.join(out_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+    return out_dir
+
+# ===============================
+# FACTORY
+# ===============================
+
+def load_embedder(backend: str, model_name: str, onnx_dir: str):
+    """Embedder for `backend`; exports the ONNX model first if onnx_dir has none"""
+    if backend == "torch":
+        return TorchEmbedder(model_name)
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+
+    quantized = backend == "onnx-int8"
+    wanted = os.path.join(onnx_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+    if not os.path.exists(wanted):
+        print(f"📦 No ONNX model in {onnx_dir}, exporting {model_name}...")
+        export_onnx(model_name, onnx_dir, quantize=quantized)
+
+    return OnnxEmbedder(onnx_dir, quantized=quantized)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export an embedding model to ONNX")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("export")
+    p.add_argument("--model", default="all-MiniLM-L6-v2")
+    p.add_argument("--out", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "all-MiniLM-L6-v2-onnx"))
+    p.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    print(f"✅ Exported to {export_onnx(args.model, args.out, quantize=not args.no_quantize)}")
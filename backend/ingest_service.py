@@ -3,25 +3,58 @@
 # Endpoints:
 #   POST /ingest        -> download PDF from URL
 #   POST /ingest-file   -> upload PDF file
+#   GET  /jobs/{id}     -> status of a background ingest
+#   GET  /chunks/{id}   -> text of one stored chunk
+#   GET  /health        -> liveness check
 #
-# Run:
-#   uvicorn ingest_service:app --reload --port 8000
-
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form
+# Pass ?background=true to /ingest or /ingest-file to get a job id back
+# immediately instead of waiting for the result.
+#
+# Run (port 8000 belongs to query_service, which the frontend talks to):
+#   uvicorn ingest_service:app --reload --port 8001
+
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Query
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import requests, os, io, hashlib, time, uuid, json
+import asyncio, random, sqlite3, threading
+import httpx, os, hashlib, time, uuid, json
 
-import pdfplumber
-from PyPDF2 import PdfReader
 from langdetect import detect
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from pdf_extract import extract_text_and_meta
+from chunk_store import ChunkStore, write_segment, segment_path
+import chunking
+from chunking import chunk_by_words
 
 # ===============================
 # APP INIT
 # ===============================
 
-app = FastAPI(title="Sansad Ingest Service")
+# PDF parsing is CPU-bound pure Python, so it runs in worker processes;
+# the rest of process_pdf_bytes runs on the threadpool
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or os.cpu_count() or 1
+parse_pool: ProcessPoolExecutor | None = None
+parse_pool_lock = threading.Lock()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global parse_pool
+    parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+    clear_incoming()
+    start_job_workers()
+    try:
+        yield
+    finally:
+        await stop_job_workers()
+        await close_http_client()
+        parse_pool.shutdown(wait=True, cancel_futures=True)
+        parse_pool = None
+
+app = FastAPI(title="Sansad Ingest Service", lifespan=lifespan)
 
 # ===============================
 # DIRECTORIES
@@ -30,10 +63,16 @@ app = FastAPI(title="Sansad Ingest Service")
 DATA_DIR = "data"
 PDF_DIR = os.path.join(DATA_DIR, "pdfs")
 CHUNK_DIR = os.path.join(DATA_DIR, "chunks")
+# Uploads are spooled here while hashing; same filesystem as PDF_DIR so
+# accepting one is a rename
+INCOMING_DIR = os.path.join(DATA_DIR, "incoming")
+INDEX_DB = os.path.join(DATA_DIR, "index.db")
+# Legacy sha256 -> filename index, migrated into INDEX_DB on startup
 INDEX_FILE = os.path.join(DATA_DIR, "index.json")
 
 os.makedirs(PDF_DIR, exist_ok=True)
 os.makedirs(CHUNK_DIR, exist_ok=True)
+os.makedirs(INCOMING_DIR, exist_ok=True)
 
 # ===============================
 # CONSTANTS
@@ -42,6 +81,22 @@ os.makedirs(CHUNK_DIR, exist_ok=True)
 USER_AGENT = "MySansadScraper/1.0 (+contact@example.com)"
 HEADERS = {"User-Agent": USER_AGENT}
 MAX_PDF_SIZE_MB = 25
+MAX_PDF_BYTES = MAX_PDF_SIZE_MB * 1024 * 1024
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
+# Same policy the old urllib3 Retry used
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF = 0.8
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Shared download client: open connections per host, and idle keep-alive pool
+DOWNLOAD_PER_HOST = int(os.getenv("DOWNLOAD_PER_HOST", "8"))
+DOWNLOAD_MAX_CONNECTIONS = int(os.getenv("DOWNLOAD_MAX_CONNECTIONS", "64"))
+DOWNLOAD_KEEPALIVE_SECONDS = 30
+
+# Background ingest: concurrent jobs, and how many finished jobs to remember
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "10000"))
 
 # ===============================
 # MODELS
@@ -58,98 +113,289 @@ class IngestRequest(BaseModel):
 def sha256_bytes(b: bytes) -> str:
     return hashlib.sha256(b).hexdigest()
 
-def load_index() -> dict:
-    if os.path.exists(INDEX_FILE):
-        with open(INDEX_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-def save_index(index: dict):
-    with open(INDEX_FILE, "w", encoding="utf-8") as f:
-        json.dump(index, f, indent=2)
-
-def download_pdf(url: str, timeout=30) -> bytes:
-    session = requests.Session()
-    retries = Retry(
-        total=3,
-        backoff_factor=0.8,
-        status_forcelist=[429, 500, 502, 503, 504],
-    )
-    adapter = HTTPAdapter(max_retries=retries)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-
-    resp = session.get(url, headers=HEADERS, timeout=timeout)
-    resp.raise_for_status()
-
-    return resp.content
-
-def extract_text_and_meta(pdf_bytes: bytes):
-    text = ""
-    meta = {}
+class PdfIndex:
+    """
+    sha256 -> stored PDF filename, in SQLite (WAL mode) with the checksum as
+    primary key: point lookups, atomic inserts, and readers never block the
+    writer. One connection per thread since requests run on the threadpool.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS pdf_index ("
+            " sha256 TEXT PRIMARY KEY,"
+            " filename TEXT NOT NULL,"
+            " created_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None -> autocommit, each statement is its own transaction
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, checksum: str) -> str | None:
+        row = self._conn().execute(
+            "SELECT filename FROM pdf_index WHERE sha256 = ?", (checksum,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def add(self, checksum: str, fname: str) -> str:
+        """Insert unless already present; returns the filename that won"""
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR IGNORE INTO pdf_index (sha256, filename, created_at) VALUES (?, ?, ?)",
+            (checksum, fname, time.time()),
+        )
+        return self.get(checksum)
+
+    def migrate_json(self, json_path: str):
+        """Import a legacy index.json once, then rename it out of the way"""
+        if not os.path.exists(json_path):
+            return
+
+        with open(json_path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO pdf_index (sha256, filename, created_at) VALUES (?, ?, ?)",
+                [(sha, fname, now) for sha, fname in legacy.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        os.replace(json_path, json_path + ".migrated")
+        print(f"Migrated {len(legacy)} entries from {json_path} to {self.path}")
+
+pdf_index = PdfIndex(INDEX_DB)
+pdf_index.migrate_json(INDEX_FILE)
+
+# Reader for the chunk segments this service writes
+chunk_store = ChunkStore(CHUNK_DIR)
+
+def _retry_delay(attempt: int, resp: httpx.Response | None) -> float:
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return DOWNLOAD_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+# One keep-alive pool for every download, so repeat fetches from the same
+# sansad.in host reuse TCP/TLS connections instead of handshaking each time
+http_client: httpx.AsyncClient | None = None
+host_slots: dict[str, asyncio.Semaphore] = {}
+
+def get_http_client() -> httpx.AsyncClient:
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            headers=HEADERS,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=DOWNLOAD_MAX_CONNECTIONS,
+                max_keepalive_connections=DOWNLOAD_MAX_CONNECTIONS,
+                keepalive_expiry=DOWNLOAD_KEEPALIVE_SECONDS,
+            ),
+        )
+    return http_client
+
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+    host_slots.clear()
+
+def host_slot(url: str) -> asyncio.Semaphore:
+    host = httpx.URL(url).host
+    if host not in host_slots:
+        host_slots[host] = asyncio.Semaphore(DOWNLOAD_PER_HOST)
+    return host_slots[host]
+
+def too_large() -> HTTPException:
+    return HTTPException(413, "PDF file too large")
+
+async def download_pdf(url: str, timeout=30) -> tuple[bytes, str]:
+    """
+    Stream the body, hashing as it arrives. Oversized responses are rejected
+    from Content-Length up front, or as soon as the running count passes
+    MAX_PDF_BYTES, so memory per download never exceeds the limit.
+    Returns (pdf_bytes, sha256).
+    """
+    client = get_http_client()
+    slot = host_slot(url)
+
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        last = attempt == DOWNLOAD_RETRIES
+        retry_resp = None
+        try:
+            async with slot, client.stream("GET", url, timeout=timeout) as resp:
+                if resp.status_code in RETRY_STATUSES and not last:
+                    retry_resp = resp
+                else:
+                    resp.raise_for_status()
+
+                    length = resp.headers.get("Content-Length")
+                    if length and length.isdigit() and int(length) > MAX_PDF_BYTES:
+                        raise too_large()
+
+                    h = hashlib.sha256()
+                    buf = bytearray()
+                    async for block in resp.aiter_bytes():
+                        if len(buf) + len(block) > MAX_PDF_BYTES:
+                            raise too_large()
+                        h.update(block)
+                        buf += block
+
+                    return bytes(buf), h.hexdigest()
+        except httpx.TransportError:
+            if last:
+                raise
+            await asyncio.sleep(_retry_delay(attempt, None))
+            continue
+
+        await asyncio.sleep(_retry_delay(attempt, retry_resp))
+
+def clear_incoming():
+    """
+    Remove uploads spooled by a previous run. Jobs live in memory, so any
+    .part file left at startup belongs to a job that was lost on restart.
+    """
+    for name in os.listdir(INCOMING_DIR):
+        if name.endswith(".part"):
+            os.remove(os.path.join(INCOMING_DIR, name))
+
+async def spool_upload(file: UploadFile) -> tuple[str, str]:
+    """
+    Copy an upload to INCOMING_DIR block by block, hashing as it goes.
+    Returns (temp_path, sha256); the temp file is removed on failure.
+    """
+    tmp_path = os.path.join(INCOMING_DIR, f"{uuid.uuid4().hex}.part")
+    h = hashlib.sha256()
+    size = 0
 
     try:
-        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-            reader = PdfReader(io.BytesIO(pdf_bytes))
-            raw_meta = reader.metadata or {}
-
-            for k, v in raw_meta.items():
-                meta[k] = str(v)
-
-            pages = []
-            for page in pdf.pages:
-                pages.append(page.extract_text() or "")
-
-            text = "\n\n".join(pages).strip()
-
-    except Exception as e:
-        print("PDF extraction error:", e)
+        with open(tmp_path, "wb") as out:
+            while block := await file.read(UPLOAD_BLOCK_SIZE):
+                size += len(block)
+                if size > MAX_PDF_BYTES:
+                    raise too_large()
+                h.update(block)
+                await run_in_threadpool(out.write, block)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return tmp_path, h.hexdigest()
+
+def replace_parse_pool(broken: ProcessPoolExecutor):
+    """Swap in a fresh pool after a worker died; the first caller to notice does it"""
+    global parse_pool
+    with parse_pool_lock:
+        if parse_pool is broken:
+            parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def parse_pdf(pdf_path: str):
+    """
+    extract_text_and_meta in a worker process when the app is running.
+    A worker that dies (segfault, OOM kill) breaks the whole pool, so the
+    pool is rebuilt and the PDF tried once more before giving up on it.
+    """
+    for _ in range(2):
+        pool = parse_pool
+        if pool is None:
+            return extract_text_and_meta(pdf_path)
+        try:
+            return pool.submit(extract_text_and_meta, pdf_path).result()
+        except BrokenProcessPool:
+            print("⚠️ PDF parse worker died, restarting the pool")
+            replace_parse_pool(pool)
 
-    return text, meta
+    raise HTTPException(422, "PDF parser crashed on this file")
 
 def chunk_text(text: str, target_words=400, overlap=0.2):
     if not text:
         return []
 
-    words = text.split()
-    chunks = []
-
-    step = int(target_words * (1 - overlap)) or target_words
-    i = 0
-
-    while i < len(words):
-        chunk = words[i:i + target_words]
-        chunks.append(" ".join(chunk))
-        i += step
-
-    return chunks
+    return chunking.chunk_text(
+        text, chunk_by_words, target_words=target_words, overlap=overlap
+    ).texts()
 
 # ===============================
 # CORE PROCESSOR
 # ===============================
 
-def process_pdf_bytes(pdf_bytes: bytes, source: str | None = None):
-    if len(pdf_bytes) > MAX_PDF_SIZE_MB * 1024 * 1024:
-        raise HTTPException(413, "PDF file too large")
+def duplicate_result(checksum: str, existing_pdf: str) -> dict:
+    return {
+        "status": "duplicate",
+        "existing_pdf": existing_pdf,
+        "sha256": checksum
+    }
 
-    checksum = sha256_bytes(pdf_bytes)
-    index = load_index()
+def process_pdf_bytes(pdf_bytes: bytes, source: str | None = None, checksum: str | None = None):
+    if len(pdf_bytes) > MAX_PDF_BYTES:
+        raise too_large()
+
+    # Streamed downloads arrive already hashed
+    checksum = checksum or sha256_bytes(pdf_bytes)
 
     # ---- Duplicate check ----
-    if checksum in index:
-        return {
-            "status": "duplicate",
-            "existing_pdf": index[checksum],
-            "sha256": checksum
-        }
-
-    fname = f"{int(time.time())}_{uuid.uuid4().hex[:8]}.pdf"
+    existing = pdf_index.get(checksum)
+    if existing:
+        return duplicate_result(checksum, existing)
+
+    fname = new_pdf_filename()
     pdf_path = os.path.join(PDF_DIR, fname)
 
     with open(pdf_path, "wb") as f:
         f.write(pdf_bytes)
 
-    text, meta = extract_text_and_meta(pdf_bytes)
+    return process_stored_pdf(fname, checksum, source)
+
+def process_pdf_file(tmp_path: str, checksum: str, source: str | None = None):
+    """Same as process_pdf_bytes for an upload already spooled to disk and hashed"""
+    existing = pdf_index.get(checksum)
+    if existing:
+        os.remove(tmp_path)
+        return duplicate_result(checksum, existing)
+
+    fname = new_pdf_filename()
+    os.replace(tmp_path, os.path.join(PDF_DIR, fname))
+
+    return process_stored_pdf(fname, checksum, source)
+
+def new_pdf_filename() -> str:
+    return f"{int(time.time())}_{uuid.uuid4().hex[:8]}.pdf"
+
+def process_stored_pdf(fname: str, checksum: str, source: str | None = None):
+    """Extract, chunk and index a PDF that is already saved under PDF_DIR"""
+    pdf_path = os.path.join(PDF_DIR, fname)
+
+    try:
+        return _process_stored_pdf(fname, pdf_path, checksum, source)
+    except BaseException:
+        # Not indexed, so nothing would ever point at these files again
+        for path in (pdf_path, segment_path(CHUNK_DIR, fname)):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+def _process_stored_pdf(fname: str, pdf_path: str, checksum: str, source: str | None):
+    # Workers read the file themselves rather than receiving a pickled copy
+    text, meta = parse_pdf(pdf_path)
 
     needs_ocr = not text or len(text) < 100
 
@@ -164,17 +410,15 @@ def process_pdf_bytes(pdf_bytes: bytes, source: str | None = None):
             pass
 
     chunks = chunk_text(text)
-    chunk_ids = []
-
-    for i, c in enumerate(chunks):
-        cid = f"{fname}.chunk{i}.txt"
-        with open(os.path.join(CHUNK_DIR, cid), "w", encoding="utf-8") as fh:
-            fh.write(c[:2000])
-        chunk_ids.append(cid)
+    chunk_ids = write_segment(CHUNK_DIR, fname, [c[:2000] for c in chunks])
 
     # ---- Save index ----
-    index[checksum] = fname
-    save_index(index)
+    # A concurrent upload of the same bytes may have finished first
+    winner = pdf_index.add(checksum, fname)
+    if winner != fname:
+        os.remove(pdf_path)
+        os.remove(segment_path(CHUNK_DIR, fname))
+        return duplicate_result(checksum, winner)
 
     return {
         "status": "ingested",
@@ -190,30 +434,170 @@ def process_pdf_bytes(pdf_bytes: bytes, source: str | None = None):
         "meta": meta,
     }
 
+async def ingest_url(url: str, source: str | None = None, job: dict | None = None):
+    if job is not None:
+        job["status"] = "downloading"
+
+    try:
+        pdf_bytes, checksum = await download_pdf(url)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Download failed: {e}")
+
+    return await ingest_bytes(pdf_bytes, source, job, checksum)
+
+async def ingest_bytes(
+    pdf_bytes: bytes,
+    source: str | None = None,
+    job: dict | None = None,
+    checksum: str | None = None,
+):
+    if job is not None:
+        job["status"] = "processing"
+
+    return await run_in_threadpool(process_pdf_bytes, pdf_bytes, source, checksum)
+
+async def ingest_spooled(tmp_path: str, checksum: str, source: str | None = None, job: dict | None = None):
+    if job is not None:
+        job["status"] = "processing"
+
+    return await run_in_threadpool(process_pdf_file, tmp_path, checksum, source)
+
+# ===============================
+# BACKGROUND JOBS
+# ===============================
+# In-process: jobs are lost on restart, which is fine for a re-submittable
+# ingest. Insertion-ordered dict doubles as the eviction order.
+
+jobs: dict[str, dict] = {}
+job_queue: asyncio.Queue | None = None
+job_tasks: list[asyncio.Task] = []
+
+def submit_job(kind: str, source: str | None, work) -> dict:
+    """Queue `work(job)` (a coroutine factory) and return the public job view"""
+    job_id = uuid.uuid4().hex
+    jobs[job_id] = {
+        "job_id": job_id,
+        "kind": kind,
+        "source": source or "",
+        "status": "queued",
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+    }
+    job_queue.put_nowait((job_id, work))
+    return jobs[job_id]
+
+def _evict_old_jobs():
+    finished = [jid for jid, j in jobs.items() if j["finished_at"] is not None]
+    for jid in finished[:max(0, len(finished) - JOB_HISTORY)]:
+        del jobs[jid]
+
+async def job_worker():
+    while True:
+        job_id, work = await job_queue.get()
+        job = jobs[job_id]
+        job["started_at"] = time.time()
+
+        try:
+            job["result"] = await work(job)
+            job["status"] = "done"
+        except HTTPException as e:
+            job["status"] = "failed"
+            job["error"] = e.detail
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = time.time()
+            job_queue.task_done()
+            _evict_old_jobs()
+
+def start_job_workers():
+    global job_queue
+    job_queue = asyncio.Queue()
+    job_tasks.extend(asyncio.create_task(job_worker()) for _ in range(JOB_WORKERS))
+
+async def stop_job_workers():
+    for t in job_tasks:
+        t.cancel()
+    await asyncio.gather(*job_tasks, return_exceptions=True)
+    job_tasks.clear()
+
+def accepted(job: dict) -> JSONResponse:
+    return JSONResponse(
+        status_code=202,
+        content={
+            "status": "queued",
+            "job_id": job["job_id"],
+            "status_url": f"/jobs/{job['job_id']}",
+        },
+    )
+
 # ===============================
 # API ENDPOINTS
 # ===============================
 
-@app.post("/ingest")
-async def ingest(req: IngestRequest):
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Unknown job id")
+    return {**job, "queue_depth": job_queue.qsize()}
+
+@app.get("/chunks/{chunk_id}")
+async def get_chunk(chunk_id: str):
     try:
-        pdf_bytes = download_pdf(req.pdf_url)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Download failed: {e}")
+        text = await run_in_threadpool(chunk_store.get, chunk_id)
+    except (KeyError, FileNotFoundError):
+        raise HTTPException(404, "Unknown chunk id")
+    return {"chunk_id": chunk_id, "text": text}
 
-    return process_pdf_bytes(pdf_bytes, source=req.source)
+@app.post("/ingest")
+async def ingest(req: IngestRequest, background: bool = Query(False)):
+    if background:
+        job = submit_job(
+            "url", req.source,
+            lambda job: ingest_url(req.pdf_url, req.source, job),
+        )
+        return accepted(job)
+
+    return await ingest_url(req.pdf_url, req.source)
 
 @app.post("/ingest-file")
 async def ingest_file(
     source: str | None = Form(None),
     file: UploadFile = File(...),
+    background: bool = Query(False),
 ):
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(400, "Only PDF files are supported")
 
     try:
-        pdf_bytes = await file.read()
+        tmp_path, checksum = await spool_upload(file)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(400, f"Failed to read file: {e}")
 
-    return process_pdf_bytes(pdf_bytes, source=source)
+    # Known PDFs are answered straight away, before any parsing or queueing
+    existing = pdf_index.get(checksum)
+    if existing:
+        os.remove(tmp_path)
+        return duplicate_result(checksum, existing)
+
+    if background:
+        job = submit_job(
+            "file", source,
+            lambda job: ingest_spooled(tmp_path, checksum, source, job),
+        )
+        return accepted(job)
+
+    return await ingest_spooled(tmp_path, checksum, source)
@@ -0,0 +1,206 @@
+# llm_client.py
+# Async LLM client for the question path
+#
+# LLMClient puts three things in front of a backend:
+#   - a semaphore bounding concurrent upstream calls
+#   - retry with exponential backoff + jitter on rate limits / overload
+#   - coalescing: identical prompts already in flight share one upstream
+#     call; late joiners replay what has streamed so far, then follow live
+#
+# Backends expose `async def stream(prompt)` yielding text pieces:
+#   GeminiBackend -> google-generativeai's async streaming API
+#   FakeBackend   -> canned answer after a configurable latency, for offline
+#                    benchmarks (python bench.py llm)
+
+import asyncio
+import hashlib
+import os
+import random
+
+# ===============================
+# CONSTANTS
+# ===============================
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "4"))
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", "1.0"))
+LLM_MAX_BACKOFF = float(os.getenv("LLM_MAX_BACKOFF", "20"))
+
+# HTTP-style codes google.api_core errors carry for "slow down / try again"
+RETRY_CODES = {429, 500, 503, 504}
+
+
+class RateLimited(Exception):
+    """Raised by FakeBackend to mimic a 429"""
+    code = 429
+
+# ===============================
+# BACKENDS
+# ===============================
+
+class GeminiBackend:
+    def __init__(self, model):
+        # A google.generativeai.GenerativeModel
+        self.model = model
+
+    async def stream(self, prompt: str):
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunk without text parts (e.g. only a finish reason)
+                continue
+            yield text
+
+
+class FakeBackend:
+    """
+    Answers after `latency` seconds (± `jitter`), streamed in `pieces` parts.
+    `rate_limit_rate` of calls fail with RateLimited before answering.
+    """
+
+    def __init__(self, latency=0.8, jitter=0.2, pieces=8, rate_limit_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.pieces = pieces
+        self.rate_limit_rate = rate_limit_rate
+        self.calls = 0
+        self._rnd = random.Random(seed)
+
+    async def stream(self, prompt: str):
+        self.calls += 1
+        total = max(0.0, self.latency + self._rnd.uniform(-self.jitter, self.jitter))
+
+        if self._rnd.random() < self.rate_limit_rate:
+            await asyncio.sleep(total * 0.1)
+            raise RateLimited("fake 429")
+
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        words = f"- Fake answer {digest} for a prompt of {len(prompt)} characters".split()
+        step = max(1, -(-len(words) // self.pieces))
+        for i in range(0, len(words), step):
+            await asyncio.sleep(total / self.pieces)
+            yield " ".join(words[i:i + step]) + " "
+
+
+def make_backend(name: str, gemini_model=None):
+    """'gemini' (needs gemini_model) or 'fake' (FAKE_LLM_LATENCY seconds per answer)"""
+    if name == "fake":
+        return FakeBackend(latency=float(os.getenv("FAKE_LLM_LATENCY", "0.8")))
+    if name == "gemini":
+        return GeminiBackend(gemini_model)
+    raise ValueError(f"Unknown LLM backend {name!r}, expected 'gemini' or 'fake'")
+
+# ===============================
+# CLIENT
+# ===============================
+
+def is_retryable(e: Exception) -> bool:
+    code = getattr(e, "code", None)
+    try:
+        return int(code) in RETRY_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+class _Broadcast:
+    """Pieces of one upstream answer, readable by any number of waiters"""
+
+    def __init__(self):
+        self.pieces = []
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Condition()
+
+    async def publish(self, piece=None, done=False, error=None):
+        async with self.changed:
+            if piece is not None:
+                self.pieces.append(piece)
+            self.done = self.done or done
+            self.error = self.error or error
+            self.changed.notify_all()
+
+    async def follow(self):
+        i = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.pieces) > i or self.done)
+                new = self.pieces[i:]
+                finished = self.done
+                error = self.error
+            for piece in new:
+                yield piece
+            i += len(new)
+            if finished and i == len(self.pieces):
+                if error is not None:
+                    raise error
+                return
+
+
+class LLMClient:
+    def __init__(self, backend, max_concurrency=LLM_CONCURRENCY, retries=LLM_RETRIES,
+                 backoff=LLM_BACKOFF, max_backoff=LLM_MAX_BACKOFF):
+        self.backend = backend
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._slots = asyncio.Semaphore(max_concurrency)
+        # prompt hash -> _Broadcast of the upstream call currently answering it
+        self._inflight: dict[str, _Broadcast] = {}
+        self._tasks = set()
+        self.stats = {"requests": 0, "upstream_calls": 0, "coalesced": 0, "retries": 0, "failures": 0}
+
+    def _delay(self, attempt: int) -> float:
+        return min(self.max_backoff, self.backoff * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+    async def _produce(self, key: str, prompt: str, out: _Broadcast):
+        try:
+            async with self._slots:
+                for attempt in range(self.retries + 1):
+                    self.stats["upstream_calls"] += 1
+                    started = False
+                    try:
+                        async for piece in self.backend.stream(prompt):
+                            started = True
+                            await out.publish(piece)
+                        break
+                    except Exception as e:
+                        # Once pieces went out a retry would repeat them
+                        if started or attempt == self.retries or not is_retryable(e):
+                            raise
+                        self.stats["retries"] += 1
+                        await asyncio.sleep(self._delay(attempt))
+            await out.publish(done=True)
+        except BaseException as e:
+            self.stats["failures"] += 1
+            await out.publish(done=True, error=e if isinstance(e, Exception) else RuntimeError("LLM call cancelled"))
+        finally:
+            self._inflight.pop(key, None)
+
+    async def stream(self, prompt: str):
+        """Yield the answer to `prompt` piece by piece"""
+        self.stats["requests"] += 1
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+        out = self._inflight.get(key)
+        if out is not None:
+            self.stats["coalesced"] += 1
+        else:
+            out = _Broadcast()
+            self._inflight[key] = out
+            # Runs on its own, so one caller disconnecting doesn't cancel the others
+            task = asyncio.create_task(self._produce(key, prompt, out))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        async for piece in out.follow():
+            yield piece
+
+    async def generate(self, prompt: str) -> str:
+        return "".join([piece async for piece in self.stream(prompt)])
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,187 @@
+# pdf_extract.py
+# PDF text extraction shared by ingest_service and rag_pipeline
+#
+# Kept free of model / DB imports on purpose: worker processes only need
+# pdfplumber, and this module is what they import.
+
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import pdfplumber
+
+# ===============================
+# CONSTANTS
+# ===============================
+
+# PDFs longer than this are split into page ranges across workers
+PAGES_PER_TASK = int(os.getenv("PAGES_PER_TASK", "50"))
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0")) or os.cpu_count() or 1
+
+# "pdfplumber" (layout-aware) or "pdfium" (much faster, for simple layouts)
+PDF_TEXT_BACKEND = os.getenv("PDF_TEXT_BACKEND", "pdfplumber")
+
+# ===============================
+# WORKER FUNCTIONS
+# ===============================
+
+def read_page_range(pdf_path: str, start: int, stop: int) -> list[str]:
+    """Extract text of pages [start, stop)"""
+    with pdfplumber.open(pdf_path) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages[start:stop]]
+
+
+def read_first_pages(pdf_path: str, stop: int) -> tuple[int, list[str]]:
+    """Extract the first pages and report the total page count"""
+    with pdfplumber.open(pdf_path) as pdf:
+        pages = pdf.pages
+        return len(pages), [page.extract_text() or "" for page in pages[:stop]]
+
+
+def join_pages(pages: list[str]) -> str:
+    return "\n".join(p for p in pages if p).strip()
+
+
+def read_pdf_text(pdf_path: str) -> str:
+    """Extract text from PDF"""
+    with pdfplumber.open(pdf_path) as pdf:
+        return join_pages([page.extract_text() or "" for page in pdf.pages])
+
+# ===============================
+# SINGLE-PASS TEXT + METADATA
+# ===============================
+
+def _meta_dict(raw: dict) -> dict:
+    # Same "/Key": "str" shape PyPDF2 used to give us
+    meta = {}
+    for k, v in (raw or {}).items():
+        if v in (None, ""):
+            continue
+        if isinstance(v, bytes):
+            v = v.decode("utf-8", errors="replace")
+        meta[k if k.startswith("/") else f"/{k}"] = str(v)
+    return meta
+
+
+def _extract_pdfplumber(pdf: bytes | str):
+    src = io.BytesIO(pdf) if isinstance(pdf, bytes) else pdf
+    with pdfplumber.open(src) as pdf:
+        pages = [page.extract_text() or "" for page in pdf.pages]
+        return pages, _meta_dict(pdf.metadata)
+
+
+def _extract_pdfium(pdf: bytes | str):
+    import pypdfium2 as pdfium
+
+    doc = pdfium.PdfDocument(pdf)
+    try:
+        pages = []
+        for page in doc:
+            textpage = page.get_textpage()
+            pages.append(textpage.get_text_range())
+            textpage.close()
+            page.close()
+        return pages, _meta_dict(doc.get_metadata_dict())
+    finally:
+        doc.close()
+
+
+def extract_text_and_meta(pdf: bytes | str, backend=PDF_TEXT_BACKEND):
+    """Page text and document metadata from a single parse of a PDF (bytes or path)"""
+    text = ""
+    meta = {}
+
+    try:
+        if backend == "pdfium":
+            pages, meta = _extract_pdfium(pdf)
+        else:
+            pages, meta = _extract_pdfplumber(pdf)
+
+        text = "\n\n".join(pages).strip()
+
+    except Exception as e:
+        print("PDF extraction error:", e)
+
+    return text, meta
+
+# ===============================
+# PARALLEL EXTRACTION
+# ===============================
+
+def extract_pdfs_parallel(pdf_paths, workers=EXTRACT_WORKERS, max_pending=None,
+                          pages_per_task=PAGES_PER_TASK):
+    """
+    Yield (pdf_path, page_texts) as PDFs finish extracting, in completion order.
+
+    Each PDF starts as one task covering its first `pages_per_task` pages;
+    if it turns out to be longer, the remaining pages are queued as extra
+    range tasks ahead of new PDFs. At most `max_pending` tasks are in flight,
+    so results are consumed about as fast as they are produced.
+    A PDF that fails to parse is yielded with None instead of its pages.
+    """
+    max_pending = max_pending or workers * 2
+    paths = iter(pdf_paths)
+
+    # path -> {"expected": task count or None, "done": n, "pages": {start: texts}, "failed": bool}
+    state = {}
+    # (future) -> (path, start)
+    pending = {}
+    ranges = deque()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+
+        def submit_next() -> bool:
+            if ranges:
+                path, start, stop = ranges.popleft()
+                fut = pool.submit(read_page_range, path, start, stop)
+            else:
+                path = next(paths, None)
+                if path is None:
+                    return False
+                start = 0
+                state[path] = {"expected": None, "done": 0, "pages": {}, "failed": False}
+                fut = pool.submit(read_first_pages, path, pages_per_task)
+
+            pending[fut] = (path, start)
+            return True
+
+        while True:
+            while len(pending) < max_pending and submit_next():
+                pass
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for fut in done:
+                path, start = pending.pop(fut)
+                st = state[path]
+                st["done"] += 1
+
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    print("PDF extraction error:", path, e)
+                    st["failed"] = True
+                    if start == 0:
+                        st["expected"] = 1
+                    result = None
+
+                if result is not None:
+                    if start == 0:
+                        total, texts = result
+                        extra = list(range(pages_per_task, total, pages_per_task))
+                        ranges.extend((path, s, min(s + pages_per_task, total)) for s in extra)
+                        st["expected"] = 1 + len(extra)
+                    else:
+                        texts = result
+                    st["pages"][start] = texts
+
+                if st["done"] == st["expected"]:
+                    del state[path]
+                    if st["failed"]:
+                        yield path, None
+                    else:
+                        yield path, [t for s in sorted(st["pages"]) for t in st["pages"][s]]
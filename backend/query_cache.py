@@ -0,0 +1,149 @@
+# query_cache.py
+# In-memory caches for the question path
+#
+# Questions on the public deployment repeat a lot, often differing only in
+# case, spacing or a trailing "?". QueryEmbeddingCache maps the normalized
+# question to its embedding and keeps count of what that saves;
+# AnswerCache reuses LLM answers for near-identical questions.
+
+import re
+import time
+import threading
+
+import numpy as np
+from cachetools import TTLCache
+
+_TRAILING_PUNCT = re.compile(r"[\s?.!]+$")
+
+# ===============================
+# QUERY EMBEDDINGS
+# ===============================
+
+def normalize_query(text: str) -> str:
+    """Case, whitespace and trailing ?/./! don't change what is being asked"""
+    return _TRAILING_PUNCT.sub("", " ".join(text.split()).casefold())
+
+
+class QueryEmbeddingCache:
+    """
+    LRU + TTL cache of normalized question -> embedding. get(question, embed)
+    returns the cached vector or calls embed(question) and remembers it.
+    Latency saved is estimated from the average time of a miss.
+    """
+
+    def __init__(self, maxsize=10000, ttl=3600):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+
+    def get(self, question: str, embed):
+        key = normalize_query(question)
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self.hits += 1
+                return vector
+
+        t0 = time.perf_counter()
+        vector = embed(question)
+        elapsed = time.perf_counter() - t0
+
+        with self._lock:
+            self._cache[key] = vector
+            self.misses += 1
+            self.miss_seconds += elapsed
+        return vector
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            avg_miss = self.miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "entries": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "avg_embed_ms": round(avg_miss * 1000, 2),
+                "saved_ms": round(self.hits * avg_miss * 1000, 1),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+# ===============================
+# ANSWERS
+# ===============================
+
+class AnswerCache:
+    """
+    Semantic cache in front of the LLM. An answer is reused when a new
+    question retrieved exactly the same chunks and its embedding is within
+    `threshold` cosine similarity of the question that produced it.
+
+    Entries are grouped by their chunk-id set, so a lookup only compares
+    against the few questions that shared its context. Everything is dropped
+    when `version` (anything that changes with the collection) changes.
+    """
+
+    def __init__(self, threshold=0.95, maxsize=2000, ttl=86400):
+        self.threshold = threshold
+        # chunk ids -> [(unit vector, answer)], LRU + TTL per context
+        self._groups = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._groups:
+                self.invalidations += 1
+            self._groups.clear()
+            self._version = version
+
+    def get(self, query_vector, chunk_ids, version=None) -> str | None:
+        key = tuple(sorted(chunk_ids))
+        with self._lock:
+            self._check_version(version)
+            group = self._groups.get(key)
+            if group:
+                q = self._unit(query_vector)
+                sims = np.stack([v for v, _ in group]) @ q
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self.hits += 1
+                    return group[best][1]
+            self.misses += 1
+            return None
+
+    def put(self, query_vector, chunk_ids, answer: str, version=None):
+        key = tuple(sorted(chunk_ids))
+        with self._lock:
+            self._check_version(version)
+            group = self._groups.get(key) or []
+            # Bounded per context too; keep the most recent questions
+            self._groups[key] = (group + [(self._unit(query_vector), answer)])[-16:]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "contexts": len(self._groups),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
@@ -0,0 +1,248 @@
+# query_service.py
+# FastAPI question-answering service over the rag_pipeline collection
+# Endpoints:
+#   POST /ask      -> {"question": ...} -> {"answer": ...}
+#   GET  /health   -> liveness + cache / concurrency / latency stats
+#
+# POST /ask?stream=true (or Accept: text/event-stream) streams the answer as
+# server-sent events while Gemini generates it:
+#   data: {"delta": "..."}                              one per piece
+#   event: done   data: {"ttft_ms": ..., "total_ms": ...}
+#   event: error  data: {"detail": "..."}
+#
+# The embedding model, Chroma collection and Gemini client are loaded once
+# at startup and stay warm. Retrieval (embedding + hybrid BM25/vector search,
+# blocking) runs on the threadpool, at most ASK_CONCURRENCY at a time; the rest wait
+# up to ASK_QUEUE_TIMEOUT seconds, then get a 503. The LLM step goes through
+# llm_client.LLMClient, which bounds upstream calls, retries rate limits and
+# shares one call between identical in-flight prompts.
+#
+# LLM_BACKEND=fake swaps Gemini for a local fake (FAKE_LLM_LATENCY seconds per
+# answer), so the whole service can be load-tested offline.
+#
+# Run (the frontend expects it on port 8000):
+#   uvicorn query_service:app --port 8000
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+import rag_pipeline
+from rag_pipeline import resources
+from llm_client import LLMClient, make_backend
+
+# ===============================
+# CONSTANTS
+# ===============================
+
+# Retrievals at once; embedding is CPU-bound, so keep this near the core count
+ASK_CONCURRENCY = int(os.getenv("ASK_CONCURRENCY", "4"))
+ASK_QUEUE_TIMEOUT = float(os.getenv("ASK_QUEUE_TIMEOUT", "30"))
+
+# Comma-separated origins allowed to call /ask from a browser (Vite dev server by default)
+CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
+
+# "gemini" or "fake"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+
+NO_CONTEXT_ANSWER = "⚠️ No relevant context found"
+
+# ===============================
+# APP INIT
+# ===============================
+
+ask_slots: asyncio.Semaphore | None = None
+llm: LLMClient | None = None
+stats = {"in_flight": 0, "waiting": 0, "answered": 0, "rejected": 0}
+# Seconds to first answer piece and to the whole answer, last 1000 questions
+ttft_samples = deque(maxlen=1000)
+total_samples = deque(maxlen=1000)
+
+
+def warm_up():
+    """Load everything /ask needs so the first request doesn't pay for it"""
+    t0 = time.perf_counter()
+    rag_pipeline.embed_text("warm up")
+    count = resources.collection.count()
+
+    backend = None
+    try:
+        gemini_model = resources.gemini_model if LLM_BACKEND == "gemini" else None
+        backend = make_backend(LLM_BACKEND, gemini_model)
+    except RuntimeError as e:
+        print(f"⚠️ {e}; /ask will return 503 until it is set")
+
+    print(f"✅ Query service warm in {time.perf_counter() - t0:.1f}s, {count} chunks, LLM: {LLM_BACKEND}")
+    return backend
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global ask_slots, llm
+    ask_slots = asyncio.Semaphore(ASK_CONCURRENCY)
+    backend = await run_in_threadpool(warm_up)
+    llm = LLMClient(backend) if backend is not None else None
+    try:
+        yield
+    finally:
+        if llm is not None:
+            await llm.close()
+
+app = FastAPI(title="Sansad Query Service", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=CORS_ORIGINS,
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type"],
+)
+
+# ===============================
+# MODELS
+# ===============================
+
+class AskRequest(BaseModel):
+    question: str
+
+# ===============================
+# CONCURRENCY
+# ===============================
+
+@asynccontextmanager
+async def ask_slot():
+    """Hold one of ASK_CONCURRENCY retrieval slots; 503 if none frees up in time"""
+    stats["waiting"] += 1
+    try:
+        await asyncio.wait_for(ask_slots.acquire(), timeout=ASK_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        stats["rejected"] += 1
+        raise HTTPException(503, "Too many questions in flight, try again shortly")
+    finally:
+        stats["waiting"] -= 1
+
+    stats["in_flight"] += 1
+    try:
+        yield
+    finally:
+        stats["in_flight"] -= 1
+        ask_slots.release()
+
+# ===============================
+# LATENCY
+# ===============================
+
+def latency_ms(samples) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def sse(data: dict, event: str | None = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def retrieve(question: str):
+    if llm is None:
+        raise HTTPException(503, "GEMINI_API_KEY not found in .env")
+    async with ask_slot():
+        return await run_in_threadpool(rag_pipeline.retrieve, question)
+
+
+async def answer_pieces(question: str, r):
+    """The answer for a retrieval result, piece by piece"""
+    if r is None:
+        yield NO_CONTEXT_ANSWER
+        return
+    if r.cached_answer is not None:
+        yield r.cached_answer
+        return
+
+    pieces = []
+    async for piece in llm.stream(rag_pipeline.build_prompt(question, r.context.text)):
+        pieces.append(piece)
+        yield piece
+    rag_pipeline.remember_answer(r, "".join(pieces))
+
+
+async def stream_events(question: str, r, t0: float):
+    """SSE for one question, timed from when the request arrived"""
+    first = None
+    try:
+        async for piece in answer_pieces(question, r):
+            if first is None:
+                first = time.perf_counter() - t0
+            yield sse({"delta": piece})
+
+        if first is None:
+            # Nothing but non-text chunks, e.g. a safety block
+            yield sse({"detail": "The model returned no answer"}, event="error")
+            return
+
+        total = time.perf_counter() - t0
+        ttft_samples.append(first)
+        total_samples.append(total)
+        stats["answered"] += 1
+        yield sse({"ttft_ms": round(first * 1000, 1), "total_ms": round(total * 1000, 1)}, event="done")
+    except Exception as e:
+        yield sse({"detail": str(e) or type(e).__name__}, event="error")
+
+# ===============================
+# API ENDPOINTS
+# ===============================
+
+@app.get("/health")
+async def health():
+    answer_cache = resources.answer_cache
+    return {
+        "status": "ok",
+        **stats,
+        "concurrency": ASK_CONCURRENCY,
+        "query_cache": resources.query_cache.stats(),
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "llm": llm.stats if llm is not None else None,
+        "context": resources.context_stats.stats(),
+        "hybrid": resources.hybrid_stats.stats(),
+        "ttft_ms": latency_ms(ttft_samples),
+        "total_ms": latency_ms(total_samples),
+    }
+
+@app.post("/ask")
+async def ask(req: AskRequest, request: Request, stream: bool = Query(False)):
+    question = req.question.strip()
+    if not question:
+        raise HTTPException(400, "Question is empty")
+
+    t0 = time.perf_counter()
+    # Retrieval happens before the 200 goes out, so overload is still a 503
+    r = await retrieve(question)
+
+    if stream or "text/event-stream" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            stream_events(question, r, t0),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    try:
+        answer = "".join([piece async for piece in answer_pieces(question, r)])
+    except Exception as e:
+        raise HTTPException(502, f"LLM call failed: {e}")
+
+    total_samples.append(time.perf_counter() - t0)
+    stats["answered"] += 1
+    return {"answer": answer}
@@ -4,17 +4,25 @@
 # ===============================
 
 import os
-import sys
+import json
+import time
+import queue
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import NamedTuple
 from dotenv import load_dotenv
 
-import chromadb
-from chromadb.config import Settings
+import numpy as np
 
-from sentence_transformers import SentenceTransformer
-import google.generativeai as genai
-
-import pdfplumber
-from textwrap import wrap
+from pdf_extract import extract_pdfs_parallel, EXTRACT_WORKERS
+import chunking
+from chunking import chunk_by_tokens, chunk_pages
+from embeddings import load_embedder
+from embedding_cache import EmbeddingCache
+from query_cache import AnswerCache, QueryEmbeddingCache
+from context_builder import ContextStats, PackedContext, build_context
+import bm25_index
 
 # ===============================
 # 1. ENV + PATHS (FIXED)
@@ -24,149 +32,678 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 
-PDF_DIR = os.path.join(BASE_DIR, "data", "pdfs")
+# PDF_DIR can point ingestion at another folder, e.g. chroma_db/data/pdfs
+PDF_DIR = os.getenv("PDF_DIR", os.path.join(BASE_DIR, "data", "pdfs"))
 CHROMA_DIR = os.path.join(BASE_DIR, "chroma_db")
 
+# sha256 -> {"pdf": filename, "chunks": count, "chunker": id}; lives next to the vectors
+# so wiping chroma_db also resets incremental state
+MANIFEST_FILE = os.path.join(CHROMA_DIR, "manifest.json")
+# BM25 segments (one per PDF) and the merged keyword index, also tied to the vectors
+BM25_DIR = os.path.join(CHROMA_DIR, "bm25")
+
 os.makedirs(PDF_DIR, exist_ok=True)
 os.makedirs(CHROMA_DIR, exist_ok=True)
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    print("❌ GEMINI_API_KEY not found in .env")
-    sys.exit(1)
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# "torch" (SentenceTransformer), "onnx" or "onnx-int8" (onnxruntime, CPU only)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Exported on first use if missing; see embeddings.py
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(BASE_DIR, "models", "all-MiniLM-L6-v2-onnx"))
+GEMINI_MODEL_NAME = "gemini-1.5-flash"
+COLLECTION_NAME = "sansad_sessions"
+
+# Extra tokens repeated between consecutive chunks
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+
+# Vectors of already-seen chunk text, so re-ingests only embed what changed.
+# EMBED_CACHE_MB=0 turns the cache off.
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join(BASE_DIR, "data", "embedding_cache"))
+EMBED_CACHE_MB = float(os.getenv("EMBED_CACHE_MB", "512"))
+EMBED_CACHE_DTYPE = os.getenv("EMBED_CACHE_DTYPE", "float16")
+
+# Question embeddings kept in memory: entries and seconds each one lives
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "10000"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+# Chunks retrieved per question, and the prompt context budget (in embedding
+# model word-pieces) they are merged and packed into. 0 means RETRIEVE_K full
+# chunks, so packing only ever saves tokens and never drops a retrieved chunk.
+RETRIEVE_K = int(os.getenv("RETRIEVE_K", "5"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+
+# Hybrid retrieval: BM25 keyword hits fused with the vector hits (reciprocal
+# rank fusion). The BM25 search runs alongside embedding + vector search and
+# is dropped for a question if it takes longer than BM25_BUDGET_MS.
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+DENSE_K = int(os.getenv("DENSE_K", "10"))
+BM25_K = int(os.getenv("BM25_K", "10"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_BUDGET_MS = float(os.getenv("BM25_BUDGET_MS", "50"))
+
+# Gemini answers reused for near-identical questions over the same chunks.
+# ANSWER_CACHE_SIZE=0 turns it off.
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+
+# Chunks are collected across PDFs and embedded this many at a time
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+# Ingest pipeline: threads per stage and how many items each queue may hold
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "1"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", "1"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
 
-print("✅ Environment loaded")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 # ===============================
-# 2. LOAD MODELS
+# 2. LAZY RESOURCES
 # ===============================
 
-print("🔧 Loading local embedding model...")
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-print("✅ Embedding model ready")
+class Resources:
+    """
+    Embedding model, Chroma collection and Gemini client, each created on
+    first use and cached. Importing this module stays cheap, and paths that
+    never ask a question never need GEMINI_API_KEY.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cache = {}
+
+    def _get(self, name, factory):
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._cache:
+                self._cache[name] = factory()
+            return self._cache[name]
+
+    # ---- Embeddings ----
+
+    @property
+    def embedding_model(self):
+        def load():
+            print(f"🔧 Loading local embedding model ({EMBEDDING_BACKEND})...")
+            model = load_embedder(EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, ONNX_MODEL_DIR)
+            print("✅ Embedding model ready")
+            return model
+
+        return self._get("embedding_model", load)
+
+    @property
+    def embedding_cache(self) -> EmbeddingCache | None:
+        def load():
+            if EMBED_CACHE_MB <= 0:
+                return None
+            # Keyed like the embedder's name, so a hit never needs the model loaded
+            model = f"{EMBEDDING_MODEL_NAME}/{EMBEDDING_BACKEND}"
+            return EmbeddingCache(
+                os.path.join(EMBED_CACHE_DIR, model.replace("/", "_")), model,
+                max_mb=EMBED_CACHE_MB, dtype=EMBED_CACHE_DTYPE,
+            )
+
+        return self._get("embedding_cache", load)
+
+    @property
+    def query_cache(self) -> QueryEmbeddingCache:
+        return self._get(
+            "query_cache",
+            lambda: QueryEmbeddingCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL),
+        )
 
-genai.configure(api_key=GEMINI_API_KEY)
-gemini_model = genai.GenerativeModel("gemini-1.5-flash")
+    @property
+    def answer_cache(self) -> AnswerCache | None:
+        def load():
+            if ANSWER_CACHE_SIZE <= 0:
+                return None
+            return AnswerCache(
+                threshold=ANSWER_CACHE_THRESHOLD, maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL,
+            )
+
+        return self._get("answer_cache", load)
+
+    @property
+    def context_stats(self) -> ContextStats:
+        return self._get("context_stats", ContextStats)
+
+    @property
+    def bm25(self) -> bm25_index.IndexHandle:
+        return self._get("bm25", lambda: bm25_index.IndexHandle(BM25_DIR))
+
+    @property
+    def hybrid_stats(self) -> bm25_index.HybridStats:
+        return self._get("hybrid_stats", bm25_index.HybridStats)
+
+    @property
+    def bm25_pool(self) -> ThreadPoolExecutor:
+        return self._get("bm25_pool", lambda: ThreadPoolExecutor(max_workers=2, thread_name_prefix="bm25"))
+
+    @property
+    def chunk_tokenizer(self):
+        # Chunks are measured in the model's own word-pieces so encode()
+        # never truncates them
+        return self._get(
+            "chunk_tokenizer",
+            lambda: chunking.detached_tokenizer(self.embedding_model.tokenizer),
+        )
 
-# ===============================
-# 3. CHROMA DB SETUP
-# ===============================
+    @property
+    def chunk_tokens(self) -> int:
+        # 2 positions go to [CLS] and [SEP]
+        return self.embedding_model.max_seq_length - 2
+
+    @property
+    def context_budget(self) -> int:
+        return CONTEXT_TOKEN_BUDGET or RETRIEVE_K * self.chunk_tokens
+
+    @property
+    def chunker_id(self) -> str:
+        """
+        Stored per PDF in the manifest; changing it re-chunks and re-embeds
+        everything on next ingest. Covers the embedder too, so switching
+        EMBEDDING_BACKEND never leaves vectors of two backends side by side.
+        """
+        return f"{EMBEDDING_MODEL_NAME}/{EMBEDDING_BACKEND}:tokens:{self.chunk_tokens}:{CHUNK_OVERLAP_TOKENS}"
+
+    # ---- Chroma ----
+
+    @property
+    def chroma_client(self):
+        def load():
+            import chromadb
+            from chromadb.config import Settings
+
+            return chromadb.PersistentClient(
+                path=CHROMA_DIR,
+                settings=Settings(anonymized_telemetry=False)
+            )
+
+        return self._get("chroma_client", load)
+
+    @property
+    def collection(self):
+        return self._get(
+            "collection",
+            lambda: self.chroma_client.get_or_create_collection(name=COLLECTION_NAME),
+        )
+
+    # ---- Gemini ----
+
+    @property
+    def gemini_model(self):
+        def load():
+            if not GEMINI_API_KEY:
+                raise RuntimeError("GEMINI_API_KEY not found in .env")
+
+            import google.generativeai as genai
+
+            genai.configure(api_key=GEMINI_API_KEY)
+            return genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+        return self._get("gemini_model", load)
 
-chroma_client = chromadb.Client(
-    Settings(
-        persist_directory=CHROMA_DIR,
-        anonymized_telemetry=False
-    )
-)
 
-collection = chroma_client.get_or_create_collection(
-    name="sansad_sessions"
-)
+resources = Resources()
+
+_LAZY_ATTRS = {
+    "embedding_model": "embedding_model",
+    "chunk_tokenizer": "chunk_tokenizer",
+    "CHUNK_TOKENS": "chunk_tokens",
+    "CHUNKER_ID": "chunker_id",
+    "chroma_client": "chroma_client",
+    "collection": "collection",
+    "gemini_model": "gemini_model",
+}
+
+
+def __getattr__(name):
+    # Old module-level names (rag_pipeline.collection etc.) still work, lazily
+    if name in _LAZY_ATTRS:
+        return getattr(resources, _LAZY_ATTRS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ===============================
 # 4. HELPERS
 # ===============================
 
-def read_pdf_text(pdf_path: str) -> str:
-    """Extract text from PDF"""
-    text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-    return text.strip()
+def sha256_file(path: str, block_size=1024 * 1024) -> str:
+    """Hash a file without loading it into memory"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
 
+def load_manifest() -> dict:
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
 
-def chunk_text(text: str, chunk_size=1200):
-    """Split text into chunks"""
-    return wrap(text, chunk_size)
+
+def save_manifest(manifest: dict):
+    """Write manifest via temp file + rename so a crash never truncates it"""
+    tmp = MANIFEST_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_FILE)
+
+
+def chunk_text(text: str, max_tokens=None):
+    """Split text into chunks that fit the embedding model's window"""
+    return chunking.chunk_text(
+        text, chunk_by_tokens,
+        tokenizer=resources.chunk_tokenizer,
+        max_tokens=max_tokens or resources.chunk_tokens,
+        overlap_tokens=CHUNK_OVERLAP_TOKENS,
+    ).texts()
 
 
 def embed_text(text: str):
     """Convert text → vector"""
-    return embedding_model.encode(text).tolist()
+    return resources.embedding_model.encode(text).tolist()
+
+
+def embed_query(question: str):
+    """embed_text for questions, served from the query cache when it repeats"""
+    return resources.query_cache.get(question, embed_text)
+
+
+def embed_batch(texts: list[str], batch_size=EMBED_BATCH_SIZE) -> np.ndarray:
+    """Convert many texts → (n, dim) float32 matrix, encoding only cache misses"""
+    cache = resources.embedding_cache
+    if cache is None:
+        return resources.embedding_model.encode(texts, batch_size=batch_size)
+
+    cached = cache.lookup(texts)
+    missing = [i for i, v in enumerate(cached) if v is None]
+    if not missing:
+        return np.stack(cached)
+
+    fresh = resources.embedding_model.encode([texts[i] for i in missing], batch_size=batch_size)
+    cache.store([texts[i] for i in missing], fresh)
+
+    out = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+    out[missing] = fresh
+    for i, v in enumerate(cached):
+        if v is not None:
+            out[i] = v
+    return out
 
 # ===============================
-# 5. INGESTION
+# 5. INGESTION PIPELINE
 # ===============================
 
-def ingest_pdfs():
+_END = object()
+
+
+class Pipeline:
+    """
+    Stages run on worker threads connected by bounded queues, so a slow stage
+    blocks its producers instead of letting work pile up in memory.
+    The first exception stops every stage and is re-raised by join().
+    """
+
+    def __init__(self):
+        self.stop = threading.Event()
+        self.threads = []
+        self.error = None
+
+    def put(self, q, item):
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+    def get(self, q, timeout=None):
+        """
+        Next item from q. Returns _END once upstream is done (or the pipeline
+        stopped) and None if nothing arrived within `timeout` seconds.
+        """
+        waited = 0.0
+        while not self.stop.is_set():
+            try:
+                item = q.get(timeout=0.2)
+            except queue.Empty:
+                waited += 0.2
+                if timeout is not None and waited >= timeout:
+                    return None
+                continue
+
+            if item is _END:
+                # Put it back so sibling workers on this queue see it too
+                q.put_nowait(_END)
+            return item
+        return _END
+
+    def stage(self, name, target, workers, inq, outq):
+        """Run target(inq, outq) on `workers` threads; the last to exit closes outq"""
+        remaining = [workers]
+        lock = threading.Lock()
+
+        def run():
+            try:
+                target(inq, outq)
+            except BaseException as e:
+                if self.error is None:
+                    self.error = e
+                self.stop.set()
+            finally:
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last and outq is not None:
+                    self.put(outq, _END)
+
+        for i in range(workers):
+            t = threading.Thread(target=run, name=f"{name}-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def join(self):
+        for t in self.threads:
+            t.join()
+        if self.error is not None:
+            raise self.error
+
+
+def chunk_ids_for(pdf: str, start: int, stop: int) -> list[str]:
+    return [f"{pdf}_{idx}" for idx in range(start, stop)]
+
+
+def commit_pdf(manifest: dict, pdf: str, checksum: str, num_chunks: int, old: tuple | None):
+    """
+    Called once every chunk of `pdf` has been upserted. New ids overwrite the
+    old ones in place, so only the tail left over from a longer previous
+    version needs deleting.
+    """
+    if old:
+        old_checksum, old_chunks = old
+        stale = chunk_ids_for(pdf, num_chunks, old_chunks)
+        if stale:
+            resources.collection.delete(ids=stale)
+        # Swapped contents: another PDF may have committed under old_checksum already
+        if manifest.get(old_checksum, {}).get("pdf") == pdf:
+            del manifest[old_checksum]
+
+    manifest[checksum] = {"pdf": pdf, "chunks": num_chunks, "chunker": resources.chunker_id}
+
+
+def purge_pdf(pdf: str):
+    """Remove every chunk of a PDF from the collection and the BM25 index"""
+    resources.collection.delete(where={"source": pdf})
+    bm25_index.remove_segment(BM25_DIR, pdf)
+
+
+def rebuild_bm25(manifest: dict):
+    """Merge the BM25 segments of every ingested PDF into the keyword index"""
+    pdfs = {entry["pdf"]: entry["chunks"] for entry in manifest.values()}
+
+    for pdf, num_chunks in pdfs.items():
+        if num_chunks and not bm25_index.has_segment(BM25_DIR, pdf):
+            # Ingested before the keyword index existed: index what's stored
+            got = resources.collection.get(where={"source": pdf}, include=["documents", "metadatas"])
+            docs = sorted(zip(got["metadatas"], got["documents"]), key=lambda md: md[0]["chunk"])
+            bm25_index.write_segment(BM25_DIR, pdf, [d for _, d in docs])
+
+    t0 = time.perf_counter()
+    bm25_index.build_index(BM25_DIR, pdfs, lambda pdf, idx: f"{pdf}_{idx}")
+    print(f"🔤 BM25 index: {sum(pdfs.values())} chunks in {time.perf_counter() - t0:.1f}s")
+
+
+def ingest_pdfs(
+    batch_size=EMBED_BATCH_SIZE,
+    workers=EXTRACT_WORKERS,
+    chunk_workers=CHUNK_WORKERS,
+    embed_workers=EMBED_WORKERS,
+    upsert_workers=UPSERT_WORKERS,
+    queue_size=INGEST_QUEUE_SIZE,
+):
+    """
+    extract -> chunk -> embed -> upsert, each stage running concurrently.
+
+    Queues between stages hold at most `queue_size` PDFs' text, two batches'
+    worth of chunks and `queue_size` embedded batches respectively.
+    """
     pdf_files = [f for f in os.listdir(PDF_DIR) if f.lower().endswith(".pdf")]
 
+    manifest = load_manifest()
+
+    # Manifest without vectors (e.g. chroma_db wiped) -> start over
+    if any(e["chunks"] for e in manifest.values()) and resources.collection.count() == 0:
+        print("⚠️ Manifest found but collection is empty, re-ingesting everything")
+        manifest = {}
+
+    by_pdf = {entry["pdf"]: (sha, entry["chunks"]) for sha, entry in manifest.items()}
+
+    # ---- Deleted PDFs ----
+    purged = sorted(set(by_pdf) - set(pdf_files))
+    for pdf in purged:
+        print(f"🗑️ Purging {pdf} (no longer in data/pdfs)")
+        purge_pdf(pdf)
+        manifest.pop(by_pdf.pop(pdf)[0], None)
+
+    save_manifest(manifest)
+    index_missing = resources.bm25.get() is None
+
     if not pdf_files:
         print("⚠️ No PDFs found in data/pdfs")
+        if purged:
+            rebuild_bm25(manifest)
         return
 
-    total_chunks = 0
-
-    for pdf in pdf_files:
-        print(f"\n📄 Processing {pdf}")
-        pdf_path = os.path.join(PDF_DIR, pdf)
-
-        text = read_pdf_text(pdf_path)
-        if not text:
-            print("⚠️ No extractable text, skipping")
-            continue
+    skipped = duplicates = 0
 
-        chunks = chunk_text(text)
+    # ---- Decide what needs extracting ----
+    checksums = {pdf: sha256_file(os.path.join(PDF_DIR, pdf)) for pdf in sorted(pdf_files)}
 
-        documents, embeddings, metadatas, ids = [], [], [], []
+    # checksum -> the one current file that gets ingested for it: the PDF
+    # already stored under it if that file still has it, else the first by name
+    owners = {}
+    for pdf, checksum in checksums.items():
+        entry = manifest.get(checksum)
+        if entry and checksums.get(entry["pdf"]) == checksum:
+            owners[checksum] = entry["pdf"]
+        else:
+            owners.setdefault(checksum, pdf)
 
-        for idx, chunk in enumerate(chunks):
-            documents.append(chunk)
-            embeddings.append(embed_text(chunk))
-            metadatas.append({
-                "source": pdf,
-                "chunk": idx
-            })
-            ids.append(f"{pdf}_{idx}")
+    todo = {}
+    for pdf, checksum in checksums.items():
+        pdf_path = os.path.join(PDF_DIR, pdf)
 
-        collection.add(
-            documents=documents,
-            embeddings=embeddings,
-            metadatas=metadatas,
-            ids=ids
-        )
+        if owners[checksum] != pdf:
+            print(f"⏭️ {pdf} is a duplicate of {owners[checksum]}, skipping")
+            if pdf in by_pdf:
+                # Edited into a copy of another PDF: its old text must go
+                print(f"🗑️ Purging {pdf}'s previous version")
+                purge_pdf(pdf)
+                manifest.pop(by_pdf.pop(pdf)[0], None)
+                purged.append(pdf)
+            duplicates += 1
+            continue
 
-        total_chunks += len(chunks)
-        print(f"✅ Stored {len(chunks)} chunks from {pdf}")
+        entry = manifest.get(checksum)
+        # Same bytes stored under another name (files renamed or swapped) still needs ingesting
+        if entry and entry["pdf"] == pdf and entry.get("chunker") == resources.chunker_id:
+            skipped += 1
+            continue
 
-    print(f"\n🎉 Ingestion complete — total chunks: {total_chunks}")
+        todo[pdf_path] = (pdf, checksum)
+
+    if purged:
+        save_manifest(manifest)
+
+    print(f"📄 Extracting {len(todo)} PDFs with {workers} workers")
+
+    pipe = Pipeline()
+    texts = queue.Queue(maxsize=queue_size)
+    chunks_q = queue.Queue(maxsize=batch_size * 2)
+    batches = queue.Queue(maxsize=queue_size)
+
+    lock = threading.Lock()
+    totals = {"chunks": 0, "failed": 0}
+    # pdf -> chunks upserted so far
+    stored = {}
+
+    def extract(_, out):
+        for pdf_path, pages in extract_pdfs_parallel(list(todo), workers=workers):
+            if pipe.stop.is_set():
+                return
+            pipe.put(out, (pdf_path, pages))
+
+    def chunk(inq, out):
+        while True:
+            item = pipe.get(inq)
+            if item is _END:
+                return
+
+            pdf_path, pages = item
+            pdf, checksum = todo[pdf_path]
+            old = by_pdf.get(pdf)
+
+            if pages is None:
+                # Not committed: old chunks stay and the PDF is retried next ingest
+                print(f"❌ {pdf}: extraction failed, will retry on next ingest")
+                with lock:
+                    totals["failed"] += 1
+                continue
+
+            chunks = chunk_pages(
+                pages, chunk_by_tokens,
+                tokenizer=resources.chunk_tokenizer,
+                max_tokens=resources.chunk_tokens,
+                overlap_tokens=CHUNK_OVERLAP_TOKENS,
+            )
+            owner = (pdf, checksum, len(chunks), old)
+            bm25_index.write_segment(BM25_DIR, pdf, chunks.texts())
+
+            if not chunks:
+                # Still committed, so a changed PDF that lost its text drops old chunks
+                print(f"⚠️ {pdf}: no extractable text, skipping")
+                pipe.put(out, (owner, None, None, None))
+                continue
+
+            for idx, span in enumerate(chunks.chunks):
+                pipe.put(out, (owner, idx, chunks[idx], span))
+
+            with lock:
+                totals["chunks"] += len(chunks)
+            print(f"✅ {pdf}: {len(chunks)} chunks" + (" (changed)" if old else ""))
+
+    def embed(inq, out):
+        documents, metadatas, ids, owners = [], [], [], []
+
+        def flush():
+            if not owners:
+                return
+            embeddings = embed_batch(documents, batch_size=batch_size) if documents else None
+            pipe.put(out, (list(documents), embeddings, list(metadatas), list(ids), list(owners)))
+            documents.clear()
+            metadatas.clear()
+            ids.clear()
+            owners.clear()
+
+        while True:
+            # Don't sit on a partial batch while upstream is busy extracting
+            item = pipe.get(inq, timeout=0.5 if owners else None)
+            if item is None:
+                flush()
+                continue
+            if item is _END:
+                flush()
+                return
+
+            owner, idx, c, span = item
+            owners.append(owner)
+            if c is not None:
+                pdf = owner[0]
+                documents.append(c)
+                metadatas.append({
+                    "source": pdf,
+                    "chunk": idx,
+                    # Provenance: 0-based pages and character offsets in the joined PDF text
+                    "page": span.page,
+                    "last_page": span.last_page,
+                    "start": span.start,
+                    "end": span.end,
+                })
+                ids.append(f"{pdf}_{idx}")
+
+            if len(documents) >= batch_size:
+                flush()
+
+    def upsert(inq, _):
+        while True:
+            item = pipe.get(inq)
+            if item is _END:
+                return
+
+            documents, embeddings, metadatas, ids, owners = item
+            if documents:
+                resources.collection.upsert(
+                    documents=documents,
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                    ids=ids
+                )
+
+            with lock:
+                finished = []
+                for owner in owners:
+                    pdf, _, num_chunks, _ = owner
+                    stored[pdf] = stored.get(pdf, 0) + (1 if num_chunks else 0)
+                    if stored[pdf] == num_chunks:
+                        del stored[pdf]
+                        finished.append(owner)
+
+                for owner in finished:
+                    commit_pdf(manifest, *owner)
+                if finished:
+                    save_manifest(manifest)
+
+    pipe.stage("extract", extract, 1, None, texts)
+    pipe.stage("chunk", chunk, chunk_workers, texts, chunks_q)
+    pipe.stage("embed", embed, embed_workers, chunks_q, batches)
+    pipe.stage("upsert", upsert, upsert_workers, batches, None)
+    pipe.join()
+
+    if todo or purged or index_missing:
+        rebuild_bm25(manifest)
+
+    print(f"\n🎉 Ingestion complete — total chunks: {totals['chunks']}, unchanged PDFs skipped: {skipped}, duplicates: {duplicates}")
+    if totals["failed"]:
+        print(f"⚠️ {totals['failed']} PDFs failed to extract and were left as they were")
+    if resources.embedding_cache is not None:
+        print(f"💾 Embedding cache: {resources.embedding_cache.stats()}")
 
 # ===============================
 # 6. ASK QUESTIONS (RAG)
 # ===============================
 
-def ask_question():
-    count = collection.count()
-    print(f"\n🔎 Collection count: {count}")
+def collection_version():
+    """Changes whenever ingestion commits a PDF (manifest rewrite) or the vector count changes"""
+    try:
+        mtime = os.stat(MANIFEST_FILE).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    return mtime, resources.collection.count()
 
-    if count == 0:
-        print("❌ No data found. Run ingestion first.")
-        return
-
-    while True:
-        question = input("\n❓ Question (or 'exit'): ").strip()
-        if question.lower() == "exit":
-            break
 
-        query_embedding = embed_text(question)
+def count_tokens(texts: list[str]) -> list[int]:
+    return [len(e.ids) for e in resources.chunk_tokenizer.encode_batch(texts, add_special_tokens=False)]
 
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=5
-        )
-
-        retrieved_chunks = results["documents"][0]
 
-        if not retrieved_chunks:
-            print("⚠️ No relevant context found")
-            continue
-
-        context = "\n\n".join(retrieved_chunks)
-
-        prompt = f"""
+def build_prompt(question: str, context: str) -> str:
+    return f"""
 You are a research assistant helping understand Indian Parliament sessions.
 
 Using ONLY the context below:
@@ -184,10 +721,189 @@ Question:
 Answer:
 """
 
-        response = gemini_model.generate_content(prompt)
 
-        print("\n🧠 Answer:\n")
-        print(response.text)
+class Retrieval(NamedTuple):
+    query_embedding: list
+    context: PackedContext
+    chunk_ids: list[str]
+    version: tuple
+    # Answer from the answer cache, if this question has effectively been asked
+    cached_answer: str | None
+
+
+def bm25_search(question: str, k=BM25_K) -> list[tuple[str, float]]:
+    return resources.bm25.search(question, k)
+
+
+def dense_search(query_embedding, k=RETRIEVE_K) -> dict:
+    """Chroma query for one embedding, unwrapped to flat lists"""
+    results = resources.collection.query(query_embeddings=[query_embedding], n_results=k)
+    return {key: results[key][0] for key in ("ids", "documents", "metadatas", "distances")}
+
+
+def search(question: str) -> tuple[dict, list]:
+    """
+    Top RETRIEVE_K chunks as {"ids", "documents", "metadatas", "distances"},
+    best first, plus the question's embedding. With HYBRID_SEARCH, BM25 and
+    vector rankings are fused and "distances" holds fused ranks instead.
+    """
+    # Keyword search runs while the question is embedded and vector-searched
+    bm25_future = resources.bm25_pool.submit(bm25_search, question) if HYBRID_SEARCH else None
+    t0 = time.perf_counter()
+
+    query_embedding = embed_query(question)
+    dense = dense_search(query_embedding, DENSE_K if bm25_future else RETRIEVE_K)
+
+    if bm25_future is None:
+        return dense, query_embedding
+
+    remaining = BM25_BUDGET_MS / 1000 - (time.perf_counter() - t0)
+    timed_out = False
+    try:
+        keyword = bm25_future.result(timeout=max(0.0, remaining))
+    except FutureTimeout:
+        timed_out = True
+        keyword = []
+
+    if not keyword:
+        resources.hybrid_stats.add(timed_out=timed_out)
+        return {key: values[:RETRIEVE_K] for key, values in dense.items()}, query_embedding
+
+    fused = [cid for cid, _ in bm25_index.rrf([dense["ids"], [cid for cid, _ in keyword]], k=RRF_K, limit=RETRIEVE_K)]
+
+    known = {cid: (doc, meta) for cid, doc, meta in zip(dense["ids"], dense["documents"], dense["metadatas"])}
+    missing = [cid for cid in fused if cid not in known]
+    resources.hybrid_stats.add(bm25_only_hits=len(missing))
+    if missing:
+        got = resources.collection.get(ids=missing, include=["documents", "metadatas"])
+        known.update({cid: (doc, meta) for cid, doc, meta in zip(got["ids"], got["documents"], got["metadatas"])})
+
+    # A stale index can name chunks that are gone; skip them
+    fused = [cid for cid in fused if cid in known]
+    return {
+        "ids": fused,
+        "documents": [known[cid][0] for cid in fused],
+        "metadatas": [known[cid][1] for cid in fused],
+        "distances": list(range(len(fused))),
+    }, query_embedding
+
+
+def retrieve(question: str) -> Retrieval | None:
+    """Embed, search and check the answer cache; None if no relevant context was found"""
+    results, query_embedding = search(question)
+
+    retrieved_chunks = results["documents"]
+
+    if not retrieved_chunks:
+        return None
+
+    chunk_ids = results["ids"]
+    version = collection_version()
+
+    # Overlapping / adjacent chunks merged, best first, within the token budget
+    context = build_context(
+        chunk_ids, retrieved_chunks, results["metadatas"], results["distances"],
+        count_tokens, budget=resources.context_budget,
+    )
+    resources.context_stats.add(context)
+
+    # Same chunks + near-identical question -> same answer, no LLM call
+    cache = resources.answer_cache
+    cached = cache.get(query_embedding, chunk_ids, version) if cache is not None else None
+
+    return Retrieval(query_embedding, context, chunk_ids, version, cached)
+
+
+def remember_answer(r: Retrieval, answer: str):
+    if resources.answer_cache is not None and answer:
+        resources.answer_cache.put(r.query_embedding, r.chunk_ids, answer, r.version)
+
+
+def stream_retrieved(question: str, r: Retrieval):
+    """Yield the answer for an already-retrieved question in pieces"""
+    if r.cached_answer is not None:
+        yield r.cached_answer
+        return
+
+    response = resources.gemini_model.generate_content(
+        build_prompt(question, r.context.text), stream=True
+    )
+
+    pieces = []
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunk without text parts (e.g. only a finish reason)
+            continue
+        pieces.append(text)
+        yield text
+
+    remember_answer(r, "".join(pieces))
+
+
+def stream_answer(question: str):
+    """
+    Retrieve context and yield Gemini's answer in pieces as it is generated.
+    Yields nothing if no relevant context was found.
+    """
+    r = retrieve(question)
+    if r is not None:
+        yield from stream_retrieved(question, r)
+
+
+def answer_question(question: str) -> str | None:
+    """Retrieve context and answer with Gemini; None if nothing relevant was found"""
+    pieces = list(stream_answer(question))
+    return "".join(pieces) if pieces else None
+
+
+def ask_question():
+    count = resources.collection.count()
+    print(f"\n🔎 Collection count: {count}")
+
+    if count == 0:
+        print("❌ No data found. Run ingestion first.")
+        return
+
+    try:
+        resources.gemini_model
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return
+
+    while True:
+        question = input("\n❓ Question (or 'exit'): ").strip()
+        if question.lower() == "exit":
+            print(f"📊 Query cache: {resources.query_cache.stats()}")
+            print(f"📊 Context: {resources.context_stats.stats()}")
+            if resources.answer_cache is not None:
+                print(f"📊 Answer cache: {resources.answer_cache.stats()}")
+            break
+
+        t0 = time.perf_counter()
+        first = None
+
+        r = retrieve(question)
+        if r is None:
+            print("⚠️ No relevant context found")
+            continue
+
+        for piece in stream_retrieved(question, r):
+            if first is None:
+                first = time.perf_counter() - t0
+                print("\n🧠 Answer:\n")
+            print(piece, end="", flush=True)
+
+        if first is None:
+            print("⚠️ Gemini returned no answer")
+            continue
+
+        print(f"\n\n⏱️ first token {first * 1000:.0f} ms, total {(time.perf_counter() - t0) * 1000:.0f} ms")
+        print(
+            f"📦 Context: {r.context.tokens} tokens from {len(r.context.passages)} passages "
+            f"({r.context.tokens_saved} saved vs {r.context.naive_tokens} verbatim)"
+        )
 
 # ===============================
 # 7. MAIN MENU
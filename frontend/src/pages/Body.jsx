@@ -6,25 +6,65 @@ function Body() {
   const [question, setQuestion] = useState("");
   const [answer, setAnswer] = useState("");
   const [loading, setLoading] = useState(false);
+  const [timing, setTiming] = useState(null);
 
-  // Send question to backend
+  // Send question to backend; the answer streams in as server-sent events
   const askQuestion = async () => {
     if (!question.trim()) return;
 
     setLoading(true);
     setAnswer("");
+    setTiming(null);
 
     try {
-      const response = await fetch("http://localhost:8000/ask", {
+      const response = await fetch("http://localhost:8000/ask?stream=true", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
+          Accept: "text/event-stream",
         },
         body: JSON.stringify({ question }),
       });
 
-      const data = await response.json();
-      setAnswer(data.answer);
+      if (!response.ok) {
+        const data = await response.json();
+        setAnswer(`❌ ${data.detail || "Request failed"}`);
+        return;
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+
+        for (const raw of events) {
+          let event = "message";
+          let data = "";
+          for (const line of raw.split("\n")) {
+            if (line.startsWith("event: ")) event = line.slice(7);
+            else if (line.startsWith("data: ")) data += line.slice(6);
+          }
+          if (!data) continue;
+
+          const payload = JSON.parse(data);
+          if (event === "done") {
+            setTiming(payload);
+          } else if (event === "error") {
+            setAnswer(`❌ ${payload.detail}`);
+          } else {
+            setAnswer((prev) => prev + payload.delta);
+          }
+        }
+      }
     } catch (error) {
       setAnswer("❌ Error connecting to backend");
     } finally {
@@ -60,7 +100,13 @@ function Body() {
         {answer && (
           <div className="mt-4 p-4 bg-gray-700 rounded">
             <h2 className="font-semibold mb-1">Answer:</h2>
-            <p className="text-sm">{answer}</p>
+            <p className="text-sm whitespace-pre-wrap">{answer}</p>
+            {timing && (
+              <p className="text-xs text-gray-400 mt-2">
+                First token {Math.round(timing.ttft_ms)} ms · total{" "}
+                {Math.round(timing.total_ms)} ms
+              </p>
+            )}
           </div>
         )}
       </div>